@@ -0,0 +1,221 @@
+"""Выгрузка и загрузка таблицы пользователей в JSONL или CSV без остановки бота.
+
+Таблица читается и пишется порциями, поэтому память не зависит от числа пользователей.
+Загрузка проверяет каждую строку и записывает пользователей пакетами в одной транзакции на порцию;
+новые слоты уведомлений работающий бот подхватывает при очередной сверке слотов.
+
+Запуск из каталога bot:
+    python admin.py export users.jsonl
+    python admin.py export users.csv
+    python admin.py import users.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import date, datetime
+from db import Database, USER_FIELDS
+from scheduler.slots import DAYS_MAP, is_valid_timezone
+
+DEFAULT_DB = os.path.join(os.getcwd(), "./db/database.db")
+CHUNK_SIZE = 10000
+
+# Сколько ошибок проверки выводить построчно (остальные только считаются)
+MAX_REPORTED_ERRORS = 20
+
+# Допустимые значения признака активности: числа из JSONL, строки из CSV
+ACTIVE_VALUES = {'1': 1, '0': 0, 'true': 1, 'false': 0}
+
+
+def detect_format(path, fmt=None):
+    """Формат файла: явно заданный или по расширению (.csv — CSV, иначе JSONL)"""
+    return fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+
+
+def open_stream(path, mode):
+    if path == '-':
+        return sys.stdout if 'w' in mode else sys.stdin
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def _optional(value):
+    # В CSV отсутствующее значение — пустая строка
+    return None if value in (None, '') else value
+
+
+def validate_user(record, today=None, handshake=None):
+    """Проверка и нормализация записи пользователя. Возвращает кортеж в порядке USER_FIELDS или бросает ValueError.
+
+    handshake подставляется записям без времени первого взаимодействия.
+    """
+    try:
+        user_id = int(record['user_id'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"некорректный user_id: {record.get('user_id')!r}")
+
+    birthdate = _optional(record.get('birthdate'))
+    if birthdate is None:
+        raise ValueError("не указана дата рождения")
+    try:
+        birthdate = date.fromisoformat(birthdate)
+    except (TypeError, ValueError):
+        raise ValueError(f"некорректная дата рождения: {birthdate!r}")
+    if birthdate > (today or date.today()):
+        raise ValueError(f"дата рождения в будущем: {birthdate}")
+
+    notify_day = record.get('notify_day')
+    if notify_day not in DAYS_MAP:
+        raise ValueError(f"некорректный день уведомлений: {notify_day!r}")
+
+    notify_time = str(record.get('notify_time'))
+    hour, _, minute = notify_time.partition(':')
+    if not (hour.isdigit() and minute.isdigit() and int(hour) < 24 and int(minute) < 60):
+        raise ValueError(f"некорректное время уведомлений: {notify_time!r}")
+
+    timezone = _optional(record.get('timezone'))
+    if timezone is not None and not is_valid_timezone(timezone):
+        raise ValueError(f"неизвестный часовой пояс: {timezone!r}")
+
+    last_notification = _optional(record.get('last_notification'))
+    if last_notification is not None:
+        try:
+            last_notification = date.fromisoformat(last_notification).isoformat()
+        except (TypeError, ValueError):
+            raise ValueError(f"некорректная дата последнего уведомления: {last_notification!r}")
+
+    # Имя нужно для текста уведомления; без него берётся username
+    username = _optional(record.get('username'))
+    custom_name = _optional(record.get('custom_name')) or username
+    if custom_name is None:
+        raise ValueError("не указано имя (custom_name или username)")
+
+    record_handshake = _optional(record.get('handshake'))
+    if record_handshake is not None:
+        try:
+            handshake = datetime.fromisoformat(record_handshake).isoformat(' ')
+        except (TypeError, ValueError):
+            raise ValueError(f"некорректное время первого взаимодействия: {record_handshake!r}")
+
+    active = _optional(record.get('active'))
+    if active is None:
+        active = 1
+    elif str(active).lower() in ACTIVE_VALUES:
+        active = ACTIVE_VALUES[str(active).lower()]
+    else:
+        raise ValueError(f"некорректный признак активности: {active!r}")
+
+    return (
+        user_id,
+        username,
+        _optional(record.get('full_name')),
+        custom_name,
+        birthdate.isoformat(),
+        handshake or datetime.now().isoformat(' '),
+        notify_day,
+        f"{int(hour):02d}:{int(minute):02d}",
+        timezone,
+        last_notification,
+        active,
+    )
+
+
+def read_records(stream, fmt):
+    """Записи файла по одной: (номер строки, запись)"""
+    if fmt == 'csv':
+        # Строка 1 — заголовок
+        yield from enumerate(csv.DictReader(stream), start=2)
+        return
+    for line_no, line in enumerate(stream, start=1):
+        if line.strip():
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, e
+
+
+def export_users(db, path, fmt, chunk_size=CHUNK_SIZE):
+    """Потоковая выгрузка таблицы users. Возвращает число выгруженных пользователей"""
+    total = 0
+    after_id = 0
+    stream = open_stream(path, 'w')
+    try:
+        writer = csv.DictWriter(stream, USER_FIELDS) if fmt == 'csv' else None
+        if writer:
+            writer.writeheader()
+        while True:
+            chunk = db.get_users_chunk(after_id, chunk_size)
+            if not chunk:
+                break
+            for _, user in chunk:
+                if writer:
+                    writer.writerow(user)
+                else:
+                    stream.write(json.dumps(user, ensure_ascii=False) + '\n')
+            total += len(chunk)
+            after_id = chunk[-1][0]
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    return total
+
+
+def import_users(db, path, fmt, chunk_size=CHUNK_SIZE):
+    """Потоковая загрузка пользователей с проверкой строк. Возвращает (загружено, отклонено)"""
+    imported = rejected = 0
+    chunk = []
+    today, handshake = date.today(), datetime.now().isoformat(' ')
+    stream = open_stream(path, 'r')
+    try:
+        for line_no, record in read_records(stream, fmt):
+            try:
+                if isinstance(record, Exception):
+                    raise ValueError(f"некорректный JSON: {record}")
+                chunk.append(validate_user(record, today, handshake))
+            except (ValueError, AttributeError) as e:
+                rejected += 1
+                if rejected <= MAX_REPORTED_ERRORS:
+                    print(f"Строка {line_no} пропущена: {e}", file=sys.stderr)
+                continue
+
+            if len(chunk) >= chunk_size:
+                db.upsert_users(chunk)
+                imported += len(chunk)
+                chunk = []
+        if chunk:
+            db.upsert_users(chunk)
+            imported += len(chunk)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return imported, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['export', 'import'], help="Выгрузка или загрузка пользователей")
+    parser.add_argument('path', help="Файл .jsonl или .csv ('-' — стандартный вывод или ввод)")
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help="Формат файла (по-умолчанию по расширению)")
+    parser.add_argument('--db', default=DEFAULT_DB, help="Путь к базе данных бота")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Пользователей в одной порции (транзакции)")
+    args = parser.parse_args()
+
+    fmt = detect_format(args.path, args.format)
+    db = Database(args.db)
+    started = time.perf_counter()
+    try:
+        if args.command == 'export':
+            total = export_users(db, args.path, fmt, args.chunk_size)
+            print(f"Выгружено пользователей: {total} за {time.perf_counter() - started:.1f} с.", file=sys.stderr)
+        else:
+            imported, rejected = import_users(db, args.path, fmt, args.chunk_size)
+            print(f"Загружено пользователей: {imported}, отклонено строк: {rejected} "
+                  f"за {time.perf_counter() - started:.1f} с. Слотов уведомлений: {len(db.get_slots())}; "
+                  f"работающий бот подхватит новые слоты при очередной сверке.", file=sys.stderr)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Локальная заглушка Telegram Bot API для нагрузочных тестов.
+
+Запуск из каталога bot:
+    python -m benchmarks.fake_api --port 8081 --latency 50 --flood-rate 0.01
+Бот подключается к ней через переменную TELEGRAM_API_URL=http://127.0.0.1:8081
+"""
+import argparse
+import asyncio
+import random
+import time
+from aiohttp import web
+
+
+class FakeTelegramAPI:
+    """aiohttp-сервер, отвечающий как Bot API и записывающий вызовы sendMessage"""
+
+    def __init__(self, latency=0.0, flood_rate=0.0, retry_after=1):
+        self.latency = latency          # Задержка ответа, с
+        self.flood_rate = flood_rate    # Доля ответов 429 Too Many Requests
+        self.retry_after = retry_after  # Значение retry_after в ответе 429
+        self.sent = []                  # (chat_id, время получения по time.monotonic)
+        self.flooded = 0
+        self.calls = 0
+        self._runner = None
+        self._next_message_id = 1
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self._handle)
+        return app
+
+    async def start(self, host='127.0.0.1', port=8081):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        self.calls += 1
+        method = request.match_info['method']
+        data = dict(await request.post()) if request.method == 'POST' else dict(request.query)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == 'sendMessage' and self.flood_rate and random.random() < self.flood_rate:
+            self.flooded += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after}
+            }, status=429)
+
+        return web.json_response({'ok': True, 'result': self._result(method, data)})
+
+    def _result(self, method, data):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Weekscounter', 'username': 'weekscounter_bot'}
+        if method == 'sendMessage':
+            chat_id = int(data['chat_id'])
+            self.sent.append((chat_id, time.monotonic()))
+            self._next_message_id += 1
+            return {
+                'message_id': self._next_message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': data.get('text', '')
+            }
+        if method == 'getUpdates':
+            return []
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0, help="Задержка ответа, мс")
+    parser.add_argument('--flood-rate', type=float, default=0, help="Доля ответов 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after в ответах 429, с")
+    args = parser.parse_args()
+
+    api = FakeTelegramAPI(args.latency / 1000, args.flood_rate, args.retry_after)
+    web.run_app(api.make_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Нагрузочный бенчмарк планировщика и рассылки на синтетической базе пользователей.
+
+Поднимает локальную заглушку Bot API, заполняет временную базу и измеряет время планирования
+при старте, пропускную способность рассылки слота, задержки доставки и пиковое потребление памяти.
+
+Запуск из каталога bot:
+    python -m benchmarks.load --users 100000 --output bench.json
+    python -m benchmarks.load --users 100000 --baseline bench.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+from aiogram import Bot
+from aiogram.bot.api import TelegramAPIServer
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from db import Database, AsyncDatabase
+from scheduler.notifier import Notifier
+from scheduler.slots import DAYS_MAP, utc_slot
+from scheduler.sender import SendPipeline
+from .fake_api import FakeTelegramAPI
+
+
+# Метрики, по которым сравниваются прогоны: имя -> True, если больше — лучше
+COMPARED_METRICS = {
+    'schedule_seconds': False,
+    'dispatch_seconds': False,
+    'throughput_per_second': True,
+    'peak_rate_per_second': False,
+    'latency_p50_ms': False,
+    'latency_p99_ms': False,
+    'peak_rss_mb': False,
+}
+
+
+def seed_users(db_path, count, slots, chunk_size=50000):
+    """Заполнение базы синтетическими пользователями, равномерно распределёнными по slots слотам"""
+    all_slots = [(day, f"{hour:02d}:00") for day in DAYS_MAP for hour in range(24)][:slots]
+    start = date(1950, 1, 1)
+    handshake = datetime.now()
+
+    db = Database(db_path)
+    with db.connection:
+        for offset in range(0, count, chunk_size):
+            rows = []
+            for user_id in range(offset + 1, min(offset + chunk_size, count) + 1):
+                notify_day, notify_time = all_slots[user_id % len(all_slots)]
+                birthdate = (start + timedelta(days=random.randint(0, 25000))).strftime("%Y-%m-%d")
+                rows.append((user_id, f"user{user_id}", f"User {user_id}", f"user{user_id}", birthdate, handshake, notify_day, notify_time))
+            db.cursor.executemany("""
+                INSERT INTO users (user_id, username, full_name, custom_name, birthdate, handshake, notify_day, notify_time)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+    # UTC-слоты считаются одним пакетным проходом, как при первом запуске после миграции
+    db.refresh_utc_slots()
+    db.close()
+    return all_slots
+
+
+def peak_rss_mb():
+    """Пиковое потребление памяти процессом (ru_maxrss: КБ в Linux, байты в macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == 'Darwin' else peak / 1024
+
+
+async def run(args):
+    logger = logging.getLogger('benchmark')
+    workdir = tempfile.mkdtemp(prefix='weekscounter-bench-')
+    db_path = os.path.join(workdir, 'database.db')
+
+    started = time.perf_counter()
+    slots = seed_users(db_path, args.users, args.slots)
+    seed_seconds = time.perf_counter() - started
+
+    api = FakeTelegramAPI(args.latency / 1000, args.flood_rate, args.retry_after)
+    await api.start(port=args.port)
+    bot = Bot(token='123456:benchmark', server=TelegramAPIServer.from_base(f"http://127.0.0.1:{args.port}"))
+    db = AsyncDatabase(db_path)
+    scheduler = AsyncIOScheduler()
+    pipeline = SendPipeline(bot, logger, workers=args.workers, rate=args.rate)
+    notifier = Notifier(bot, db, logger, scheduler, pipeline, spread_window=timedelta(minutes=args.spread_minutes))
+
+    try:
+        scheduler.start()
+        pipeline.start()
+        notifier.delivered.start()
+        await notifier.outbox.start()
+
+        # Планирование при старте
+        started = time.perf_counter()
+        await notifier.schedule_notifications()
+        schedule_seconds = time.perf_counter() - started
+
+        # Рассылка первого (самого населённого) слота до полного опустошения очереди
+        slot = utc_slot(*slots[0])
+        dispatch_started = time.monotonic()
+        await notifier.dispatch_slot(slot)
+        # Уведомления уходят через outbox: ждём, пока все будут захвачены и отправлены
+        while {'pending', 'claimed'} & set(await db.count_outbox()):
+            await asyncio.sleep(0.05)
+        await pipeline.queue.join()
+        dispatch_seconds = time.monotonic() - dispatch_started
+        await notifier.delivered.flush()
+
+        latencies = np.array([received - dispatch_started for _, received in api.sent]) * 1000
+        delivered = len(api.sent)
+        # Пиковая скорость: максимум сообщений, полученных заглушкой за одну секунду
+        peak_rate = int(np.bincount((latencies // 1000).astype(np.int64)).max()) if delivered else 0
+    finally:
+        await notifier.stop()
+        await db.close()
+        await (await bot.get_session()).close()
+        await api.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'benchmark': 'load',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'params': vars(args),
+        'seed_seconds': seed_seconds,
+        'schedule_seconds': schedule_seconds,
+        'slot_jobs': len(notifier.slot_jobs),
+        'delivered': delivered,
+        'flooded': api.flooded,
+        'dispatch_seconds': dispatch_seconds,
+        'throughput_per_second': delivered / dispatch_seconds if dispatch_seconds else 0,
+        'peak_rate_per_second': peak_rate,
+        'latency_p50_ms': float(np.percentile(latencies, 50)) if delivered else None,
+        'latency_p90_ms': float(np.percentile(latencies, 90)) if delivered else None,
+        'latency_p99_ms': float(np.percentile(latencies, 99)) if delivered else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(result, baseline_path):
+    """Сравнение с предыдущим прогоном: изменение каждой метрики в процентах"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    report = {}
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        old, new = baseline.get(metric), result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        report[metric] = {
+            'baseline': old,
+            'current': new,
+            'change_percent': round(change, 1),
+            'regression': change < 0 if higher_is_better else change > 0
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000, help="Число пользователей в базе")
+    parser.add_argument('--slots', type=int, default=1, help="Число слотов, по которым распределены пользователи (1-168)")
+    parser.add_argument('--workers', type=int, default=32, help="Число воркеров отправки")
+    parser.add_argument('--rate', type=float, default=10000, help="Глобальный лимит отправки, сообщений/с")
+    parser.add_argument('--latency', type=float, default=0, help="Задержка ответа заглушки Bot API, мс")
+    parser.add_argument('--flood-rate', type=float, default=0, help="Доля ответов 429 от заглушки")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after в ответах 429, с")
+    parser.add_argument('--spread-minutes', type=float, default=0, help="Максимальное окно рассылки слота, мин (0 — без растягивания)")
+    parser.add_argument('--port', type=int, default=8081, help="Порт заглушки Bot API")
+    parser.add_argument('--output', help="Файл для результатов в формате JSON")
+    parser.add_argument('--baseline', help="Результат предыдущего прогона для сравнения")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    result = asyncio.run(run(args))
+    if args.baseline:
+        result['comparison'] = compare(result, args.baseline)
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Сравнение пакетной генерации текстов уведомлений с генерацией по одному пользователю.
+
+Запуск из каталога bot:
+    python -m benchmarks.render --users 100000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, timedelta
+from scheduler.notifier import generate_notification_text, render_notification_texts
+
+
+def make_users(count):
+    """Синтетические профили со случайными датами рождения"""
+    start = date(1950, 1, 1)
+    return [
+        {
+            'custom_name': f"user{i}",
+            'birthdate': (start + timedelta(days=random.randint(0, 25000))).strftime("%Y-%m-%d")
+        }
+        for i in range(count)
+    ]
+
+
+def measure(func, repeat):
+    """Лучшее время из repeat запусков"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000, help="Число получателей в слоте")
+    parser.add_argument('--repeat', type=int, default=5, help="Число повторов каждого замера")
+    parser.add_argument('--output', help="Файл для результатов в формате JSON")
+    args = parser.parse_args()
+
+    users = make_users(args.users)
+    per_user = measure(lambda: [generate_notification_text(user_info) for user_info in users], args.repeat)
+    batch = measure(lambda: render_notification_texts(users), args.repeat)
+
+    result = {
+        'benchmark': 'render',
+        'users': args.users,
+        'per_user_seconds': per_user,
+        'batch_seconds': batch,
+        'speedup': per_user / batch,
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""Воспроизведение потока обновлений через диспетчер для оценки входящей нагрузки.
+
+Прогоняет регистрацию (/start -> имя -> дата рождения -> день -> час) для множества
+одновременных пользователей через dp.process_update и измеряет задержку обработчиков,
+размер FSM-хранилища и задержку цикла событий. Обновления синтезируются или читаются
+из JSONL, записанного ботом с переменной RECORD_UPDATES.
+
+Запуск из каталога bot:
+    python -m benchmarks.replay --users 2000 --rate 200
+    python -m benchmarks.replay --users 2000 --save updates.jsonl   # только сгенерировать поток
+    python -m benchmarks.replay --input updates.jsonl --output replay.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict, defaultdict
+import numpy as np
+from .fake_api import FakeTelegramAPI
+
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Шаги регистрации синтетического пользователя
+REGISTRATION_STEPS = ["/start", "{name}", "01.01.1990", "Пн", "9", "Москва"]
+
+
+def synthesize_updates(users, first_user_id=10 ** 9):
+    """Поток обновлений регистрации для users пользователей (по шагам, пользователи чередуются)"""
+    update_id = 0
+    for step in REGISTRATION_STEPS:
+        for i in range(users):
+            user_id = first_user_id + i
+            text = step.format(name=f"user{i}")
+            message = {
+                'message_id': update_id + 1,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': f"User {i}", 'username': f"user{i}"},
+                'text': text,
+            }
+            if text.startswith('/'):
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+            update_id += 1
+            yield {'update_id': update_id, 'message': message}
+
+
+def read_updates(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def group_by_user(updates):
+    """Обновления каждого пользователя воспроизводятся последовательно, пользователи — параллельно"""
+    flows = OrderedDict()
+    for update in updates:
+        message = update.get('message') or update.get('edited_message') or {}
+        user_id = message.get('from', {}).get('id', 0)
+        flows.setdefault(user_id, []).append(update)
+    return flows
+
+
+def percentiles(values, unit=1000):
+    if not values:
+        return None
+    values = np.array(values) * unit
+    return {
+        'count': len(values),
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max()),
+    }
+
+
+async def fsm_storage_size(storage, db):
+    """Размер FSM-хранилища: записи в памяти процесса и в базе"""
+    data = getattr(storage, 'data', None)
+    if data is not None:  # MemoryStorage
+        entries = sum(len(users) for users in data.values())
+        return {'cached': entries, 'bytes': len(json.dumps(data, default=str))}
+    return {
+        'cached': len(storage.cache),
+        'pending_writes': len(storage.pending),
+        'in_database': await db.count_fsm_records(),
+    }
+
+
+async def sample_loop_lag(samples, interval=0.01):
+    """Задержка цикла событий: насколько позже запланированного просыпается sleep"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def run(args, flows):
+    # Бот работает в отдельном каталоге со своей базой и логами
+    workdir = tempfile.mkdtemp(prefix='weekscounter-replay-')
+    os.makedirs(os.path.join(workdir, 'db'))
+    os.chdir(workdir)
+    os.environ['TOKEN'] = '123456:replay'
+    os.environ['TELEGRAM_API_URL'] = f"http://127.0.0.1:{args.port}"
+    # Измеряется обработка обновлений, а не общий лимит частоты (его можно задать явно)
+    os.environ.setdefault('THROTTLE_GLOBAL_RATE', '0')
+    sys.path.insert(0, BOT_DIR)
+
+    api = FakeTelegramAPI(args.latency / 1000)
+    await api.start(port=args.port)
+
+    # Импорт внутри цикла событий: core создаёт объекты asyncio при загрузке
+    from aiogram import Bot, Dispatcher, types
+    from core import bot, db, storage, followups, notifier
+    from handlers import dp
+    logging.getLogger().setLevel(logging.WARNING)
+
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+    storage.start()
+    followups.start()
+    await notifier.start()
+
+    latencies = defaultdict(list)
+    lag = []
+    lag_task = asyncio.create_task(sample_loop_lag(lag))
+
+    async def replay_flow(updates):
+        for raw in updates:
+            update = types.Update.to_object(raw)
+            message = update.message
+            # Шаг определяется состоянием FSM до обработки (или командой)
+            step = await dp.storage.get_state(chat=message.chat.id, user=message.from_user.id) if message else None
+            if message and message.is_command():
+                step = message.get_command()
+            started = time.perf_counter()
+            # Отдельная задача на обновление, как в executor: у каждой свой контекст (aiogram кэширует в нём состояние FSM)
+            await asyncio.create_task(dp.process_update(update))
+            latencies[step or 'none'].append(time.perf_counter() - started)
+            if args.think:
+                await asyncio.sleep(args.think)
+
+    started = time.perf_counter()
+    tasks = []
+    try:
+        for updates in flows.values():
+            tasks.append(asyncio.create_task(replay_flow(updates)))
+            if args.rate:
+                await asyncio.sleep(1 / args.rate)
+        storage_peak = await fsm_storage_size(dp.storage, db)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        await storage.writes.flush()
+        storage_after = await fsm_storage_size(dp.storage, db)
+    finally:
+        lag_task.cancel()
+        await notifier.stop()
+        await followups.stop()
+        await storage.close()
+        await db.close()
+        await (await bot.get_session()).close()
+        await api.stop()
+        os.chdir(BOT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        'benchmark': 'replay',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'params': vars(args),
+        'users': len(flows),
+        'updates': len(all_latencies),
+        'elapsed_seconds': elapsed,
+        'updates_per_second': len(all_latencies) / elapsed if elapsed else 0,
+        'handler_latency_ms': percentiles(all_latencies),
+        'handler_latency_by_step_ms': {step: percentiles(values) for step, values in latencies.items()},
+        'fsm_storage_after_spawn': storage_peak,
+        'fsm_storage_after_replay': storage_after,
+        'event_loop_lag_ms': percentiles(lag),
+        'messages_sent': len(api.sent),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000, help="Число синтетических пользователей")
+    parser.add_argument('--input', help="JSONL с записанными обновлениями вместо синтетических")
+    parser.add_argument('--save', help="Сохранить синтетический поток в JSONL и выйти")
+    parser.add_argument('--rate', type=float, default=100, help="Скорость появления новых пользователей, в секунду (0 — все сразу)")
+    parser.add_argument('--think', type=float, default=0.5, help="Пауза пользователя между шагами, с")
+    parser.add_argument('--latency', type=float, default=0, help="Задержка ответа заглушки Bot API, мс")
+    parser.add_argument('--port', type=int, default=8081, help="Порт заглушки Bot API")
+    parser.add_argument('--output', help="Файл для результатов в формате JSON")
+    args = parser.parse_args()
+
+    updates = read_updates(args.input) if args.input else synthesize_updates(args.users)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            for update in updates:
+                f.write(json.dumps(update, ensure_ascii=False) + "\n")
+        return
+
+    result = asyncio.run(run(args, group_by_user(updates)))
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
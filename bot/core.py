@@ -1,31 +1,23 @@
 import os
 import logging
-from logging.handlers import RotatingFileHandler
+from datetime import timedelta
 from aiogram import Bot, Dispatcher, executor
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.bot.api import TelegramAPIServer
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from db import Database
+from db import AsyncDatabase
+from fsm_storage import SQLiteStorage
+from logging_config import setup_logging
+from metrics import SEND_QUEUE_DEPTH
+from middlewares import HandlerMetrics, Throttling, UpdateRecorder
+from scheduler.delayed import DelayedQueue
 from scheduler.notifier import Notifier
+from scheduler.sender import SendPipeline
 
 
-# Настройка логирования
+# Настройка логирования: запись в файл и консоль выполняется в фоновом потоке
 log_dir = os.path.join(os.getcwd(), "./logs/")
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
-
 try:
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        handlers=[
-            RotatingFileHandler(
-                os.path.join(log_dir, "bot.log"),
-                maxBytes=10 * 1024 * 1024,   # 10 MB
-                backupCount=3                # Хранить 3 backup-файла
-            ),
-            logging.StreamHandler()
-        ]
-    )
+    setup_logging(log_dir, os.getenv('LOG_FILE', "bot.log"), os.getenv('LOG_FORMAT', "json"))
     logger = logging.getLogger(__name__)
 except Exception as e:
     print(f"Ошибка при инициализации логирования: {e}")
@@ -37,22 +29,85 @@ if not TOKEN:
     logger.critical("Токен бота не найден в переменных окружения! Проверьте переменную TOKEN.")
     raise ValueError("Токен бота не найден в переменных окружения!")
 
-# Инициализация бота и диспетчера
-bot = Bot(token=TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(bot, storage=storage)
+# Адрес Bot API: локальный сервер Bot API или заглушка для тестов (по-умолчанию api.telegram.org)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# Режим вебхука включается переменной WEBHOOK_HOST (публичный адрес, например https://bot.example.com)
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('WEBAPP_PORT', 8080))
+
+# Путь к JSONL-файлу для записи входящих обновлений (для воспроизведения нагрузки)
+RECORD_UPDATES = os.getenv('RECORD_UPDATES')
+
+# Порт HTTP-сервера метрик Prometheus (отключён, если не задан) и адрес, на котором он слушает
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Рассылку уведомлений выполняет только один процесс, остальные экземпляры лишь принимают обновления
+RUN_NOTIFIER = os.getenv('RUN_NOTIFIER', '1') != '0'
+
+# Число процессов рассылки. При NOTIFIER_WORKERS > 0 основной процесс только принимает обновления,
+# а рассылку ведут дочерние процессы worker.py, каждый по своей доле пользователей (user_id % N)
+NOTIFIER_WORKERS = int(os.getenv('NOTIFIER_WORKERS', 0))
+
+# Доля пользователей процесса рассылки в виде "index/count" (задаётся процессам worker.py)
+NOTIFIER_SHARD = os.getenv('NOTIFIER_SHARD')
+shard = tuple(map(int, NOTIFIER_SHARD.split('/'))) if NOTIFIER_SHARD else None
 
 # Инициализация базы данных
 db_path = os.path.join(os.getcwd(), "./db/database.db")
 try:
-    db = Database(db_path)
+    db = AsyncDatabase(db_path)
     logger.info(f"База данных успешно инициализирована.")
 except Exception as e:
     logger.critical(f"Ошибка при инициализации базы данных: {e}")
     raise
 
+# Инициализация бота и диспетчера
+if TELEGRAM_API_URL:
+    bot = Bot(token=TOKEN, server=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+else:
+    bot = Bot(token=TOKEN)
+storage = SQLiteStorage(db, logger, ttl=int(os.getenv('FSM_STATE_TTL', 7 * 24 * 3600)))
+dp = Dispatcher(bot, storage=storage)
+# Ограничение частоты — первым, чтобы отброшенные сообщения не доходили до остальной обработки
+dp.middleware.setup(Throttling(
+    rate=float(os.getenv('THROTTLE_RATE', 1)),
+    burst=int(os.getenv('THROTTLE_BURST', 5)),
+    global_rate=float(os.getenv('THROTTLE_GLOBAL_RATE', 300))
+))
+dp.middleware.setup(HandlerMetrics())
+
+# Запись входящих обновлений
+recorder = None
+if RECORD_UPDATES:
+    recorder = UpdateRecorder(RECORD_UPDATES)
+    dp.middleware.setup(recorder)
+    logger.info(f"Входящие обновления записываются в {RECORD_UPDATES}.")
+
+# Отложенные сообщения диалогов (паузы между репликами без ожидания в обработчике)
+followups = DelayedQueue(bot, logger)
+
 # Инициализация планировщика
 scheduler = AsyncIOScheduler()
 
+# Инициализация конвейера отправки (лимиты Telegram: ~30 сообщений/с на бота, ~1 сообщение/с в чат)
+# Лимит на бота общий, поэтому процессы рассылки делят SEND_RATE поровну
+pipeline = SendPipeline(
+    bot, logger,
+    workers=int(os.getenv('SEND_WORKERS', 8)),
+    rate=float(os.getenv('SEND_RATE', 25)) / (shard[1] if shard else 1)
+)
+SEND_QUEUE_DEPTH.set_function(lambda: pipeline.queue_depth)
+
 # Инициализация планировщика уведомления
-notifier = Notifier(bot, db, logger, scheduler)
+notifier = Notifier(
+    bot, db, logger, scheduler, pipeline,
+    enabled=RUN_NOTIFIER and (shard is not None or not NOTIFIER_WORKERS),
+    catchup_rate=float(os.getenv('CATCHUP_RATE', 10)) / (shard[1] if shard else 1),
+    catchup_max_age=timedelta(hours=float(os.getenv('CATCHUP_MAX_AGE_HOURS', 12))),
+    spread_window=timedelta(minutes=float(os.getenv('SLOT_SPREAD_MINUTES', 10))),
+    shard=shard
+)
@@ -1,30 +1,128 @@
+import asyncio
 import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
+from metrics import DB_QUERY_SECONDS
+from scheduler.slots import utc_slot
+
+
+# Миграции схемы базы данных. Каждая миграция — список SQL-выражений,
+# применяется одной транзакцией. Новые миграции добавляются только в конец списка
+MIGRATIONS = [
+    # 1: Таблица пользователей
+    [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id BIGINT UNIQUE,
+            username VARCHAR(255),
+            full_name VARCHAR(255),
+            custom_name VARCHAR(255),
+            birthdate DATE,
+            handshake TIMESTAMP,
+            notify_day SMALLINT,
+            notify_time TIME,
+            last_notification DATE
+        )
+        """
+    ],
+    # 2: Индексы для выборки получателей слота и поиска пропущенных уведомлений
+    [
+        "CREATE INDEX IF NOT EXISTS idx_users_slot ON users (notify_day, notify_time)",
+        "CREATE INDEX IF NOT EXISTS idx_users_last_notification ON users (last_notification)",
+    ],
+    # 3: user_id в индексе слота — порционное чтение слота без сортировки
+    [
+        "DROP INDEX IF EXISTS idx_users_slot",
+        "CREATE INDEX IF NOT EXISTS idx_users_slot ON users (notify_day, notify_time, user_id)",
+    ],
+    # 4: Состояния FSM (незавершённые диалоги переживают перезапуск бота)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            chat BIGINT,
+            user BIGINT,
+            state VARCHAR(255),
+            data TEXT,
+            updated_at REAL,
+            PRIMARY KEY (chat, user)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states (updated_at)",
+    ],
+    # 5: Очередь исходящих уведомлений (outbox). Не больше одного уведомления пользователю за неделю
+    [
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id BIGINT NOT NULL,
+            week VARCHAR(8) NOT NULL,
+            text TEXT NOT NULL,
+            state VARCHAR(8) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL,
+            updated_at REAL,
+            UNIQUE (user_id, week)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox (state, id)",
+    ],
+    # 6: Недоступные пользователи (заблокировали бота, удалили аккаунт) исключаются из рассылки.
+    # Индекс слота частичный: в него попадают только активные пользователи
+    [
+        "ALTER TABLE users ADD COLUMN active BOOLEAN NOT NULL DEFAULT 1",
+        "DROP INDEX IF EXISTS idx_users_slot",
+        "CREATE INDEX IF NOT EXISTS idx_users_slot ON users (notify_day, notify_time, user_id) WHERE active = 1",
+    ],
+    # 7: Время, раньше которого уведомление не отправляется (рассылка слота растягивается на окно)
+    [
+        "ALTER TABLE outbox ADD COLUMN due_at REAL NOT NULL DEFAULT 0",
+        "DROP INDEX IF EXISTS idx_outbox_state",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (state, due_at)",
+    ],
+    # 8: Часовой пояс пользователя и UTC-слот — минута недели в UTC, на которую приходится его локальное время уведомления.
+    # Индекс слота строится по UTC-слоту; второй индекс группирует пользователей для пересчёта слотов при переходе на летнее время
+    [
+        "ALTER TABLE users ADD COLUMN timezone VARCHAR(64)",
+        "ALTER TABLE users ADD COLUMN utc_slot SMALLINT",
+        "DROP INDEX IF EXISTS idx_users_slot",
+        "CREATE INDEX IF NOT EXISTS idx_users_slot ON users (utc_slot, user_id) WHERE active = 1",
+        "CREATE INDEX IF NOT EXISTS idx_users_timezone ON users (timezone, notify_day, notify_time, utc_slot)",
+    ],
+]
+
+# Поля пользователя при выгрузке и загрузке таблицы users (admin.py)
+USER_FIELDS = ('user_id', 'username', 'full_name', 'custom_name', 'birthdate', 'handshake',
+               'notify_day', 'notify_time', 'timezone', 'last_notification', 'active')
 
 
 class Database:
     def __init__(self, db_file):
         self.connection = sqlite3.connect(db_file)
         self.cursor = self.connection.cursor()
-        self._create_tables()
+        self._configure()
+        self._migrate()
 
-    def _create_tables(self):
-        """Создание таблиц, если они не существуют."""
-        with self.connection:
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id BIGINT UNIQUE,
-                    username VARCHAR(255),
-                    full_name VARCHAR(255),
-                    custom_name VARCHAR(255),
-                    birthdate DATE,
-                    handshake TIMESTAMP,
-                    notify_day SMALLINT,
-                    notify_time TIME,
-                    last_notification DATE
-                )
-            """)
+    def _configure(self):
+        """Настройка SQLite: WAL позволяет читать во время записи, synchronous=NORMAL снижает число fsync."""
+        self.cursor.execute("PRAGMA journal_mode = WAL")
+        self.cursor.execute("PRAGMA synchronous = NORMAL")
+        self.cursor.execute("PRAGMA temp_store = MEMORY")
+        self.cursor.execute("PRAGMA cache_size = -16000")  # ~16 MB
+        self.cursor.execute("PRAGMA busy_timeout = 5000")
+
+    def _migrate(self):
+        """Применение миграций схемы. Номер версии схемы хранится в PRAGMA user_version."""
+        version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            with self.connection:
+                self.cursor.execute("BEGIN")
+                for statement in statements:
+                    self.cursor.execute(statement)
+                self.cursor.execute(f"PRAGMA user_version = {number}")
 
     def user_exists(self, user_id):
         """Проверка существования пользователя."""
@@ -32,16 +130,17 @@ class Database:
             result = self.cursor.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone()
             return bool(result)
 
-    def add_user(self, user_id, username, full_name, custom_name, birthdate, notify_day, notify_time):
-        """Добавление нового пользователя."""
+    def add_user(self, user_id, username, full_name, custom_name, birthdate, notify_day, notify_time, timezone=None):
+        """Добавление нового пользователя. timezone — имя часового пояса IANA (None — пояс сервера)."""
         handshake = datetime.now()
         with self.connection:
             self.cursor.execute("""
-                INSERT INTO users (user_id, username, full_name, custom_name, birthdate, handshake, notify_day, notify_time)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, username, full_name, custom_name, birthdate, handshake, notify_day, notify_time))
+                INSERT INTO users (user_id, username, full_name, custom_name, birthdate, handshake, notify_day, notify_time, timezone, utc_slot)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, username, full_name, custom_name, birthdate, handshake, notify_day, notify_time, timezone,
+                  utc_slot(notify_day, notify_time, timezone)))
 
-    def update_user(self, user_id, custom_name=None, birthdate=None, notify_day=None, notify_time=None):
+    def update_user(self, user_id, custom_name=None, birthdate=None, notify_day=None, notify_time=None, timezone=None):
         """Обновление данных пользователя."""
         with self.connection:
             if custom_name:
@@ -52,6 +151,10 @@ class Database:
                 self.cursor.execute("UPDATE users SET notify_day = ? WHERE user_id = ?", (notify_day, user_id))
             if notify_time:
                 self.cursor.execute("UPDATE users SET notify_time = ? WHERE user_id = ?", (notify_time, user_id))
+            if timezone:
+                self.cursor.execute("UPDATE users SET timezone = ? WHERE user_id = ?", (timezone, user_id))
+            if notify_day or notify_time or timezone:
+                self._update_utc_slot(user_id)
 
     def update_birthdate(self, user_id, birthdate):
         """Обновление даты рождения пользователя."""
@@ -62,17 +165,67 @@ class Database:
         """Обновление настроек уведомлений."""
         with self.connection:
             self.cursor.execute("UPDATE users SET notify_day = ?, notify_time = ? WHERE user_id = ?", (notify_day, notify_time, user_id))
+            self._update_utc_slot(user_id)
+
+    def _update_utc_slot(self, user_id):
+        """Пересчёт UTC-слота пользователя по его дню, времени и часовому поясу (внутри транзакции вызывающего)."""
+        row = self.cursor.execute(
+            "SELECT notify_day, notify_time, timezone FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row and row[0] and row[1]:
+            self.cursor.execute("UPDATE users SET utc_slot = ? WHERE user_id = ?", (utc_slot(*row), user_id))
+
+    def refresh_utc_slots(self, now=None):
+        """Пересчёт UTC-слотов после перехода на летнее или зимнее время. Возвращает число изменённых пользователей.
+
+        Слот считается один раз на группу (пояс, день, время), изменённые группы обновляются одной транзакцией по индексу.
+        Пользователи без слота (записанные до появления часовых поясов) получают его здесь же.
+        """
+        with self.connection:
+            groups = self.cursor.execute("""
+                SELECT timezone, notify_day, notify_time, utc_slot FROM users
+                WHERE notify_day IS NOT NULL AND notify_time IS NOT NULL
+                GROUP BY timezone, notify_day, notify_time, utc_slot
+            """).fetchall()
+            changed = []
+            for tz_name, notify_day, notify_time, slot in groups:
+                new_slot = utc_slot(notify_day, notify_time, tz_name, now)
+                if new_slot != slot:
+                    changed.append((new_slot, tz_name, notify_day, notify_time, slot))
+            if not changed:
+                return 0
+            self.cursor.executemany(
+                "UPDATE users SET utc_slot = ? WHERE timezone IS ? AND notify_day = ? AND notify_time = ? AND utc_slot IS ?",
+                changed
+            )
+            return self.cursor.rowcount
 
     def update_last_notification(self, user_id, date):
         """Обновление даты последнего уведомления."""
         with self.connection:
             self.cursor.execute("UPDATE users SET last_notification = ? WHERE user_id = ?", (date, user_id))
 
+    def deactivate_users(self, user_ids):
+        """Исключение недоступных пользователей из рассылки одной транзакцией."""
+        with self.connection:
+            self.cursor.executemany("UPDATE users SET active = 0 WHERE user_id = ?", [(user_id,) for user_id in user_ids])
+
+    def is_active(self, user_id):
+        """Участвует ли пользователь в рассылке. Читается из базы, минуя кэш профилей."""
+        with self.connection:
+            result = self.cursor.execute("SELECT active FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            return bool(result and result[0])
+
+    def activate_user(self, user_id):
+        """Возврат пользователя в рассылку. Возвращает True, если он был исключён."""
+        with self.connection:
+            return self.cursor.execute("UPDATE users SET active = 1 WHERE user_id = ? AND active = 0", (user_id,)).rowcount > 0
+
     def get_user_info(self, user_id):
         """Получение информации о пользователе."""
         with self.connection:
             result = self.cursor.execute(
-                "SELECT custom_name, birthdate, notify_day, notify_time FROM users WHERE user_id = ?",
+                "SELECT custom_name, birthdate, notify_day, notify_time, timezone FROM users WHERE user_id = ?",
                 (user_id,)
             ).fetchone()
             if result:
@@ -80,7 +233,8 @@ class Database:
                     "custom_name": result[0],
                     "birthdate": result[1],
                     "notify_day": result[2],
-                    "notify_time": result[3]
+                    "notify_time": result[3],
+                    "timezone": result[4]
                 }
             return None
 
@@ -90,6 +244,251 @@ class Database:
             result = self.cursor.execute("SELECT user_id FROM users").fetchall()
             return [row[0] for row in result]
 
+    def get_users_chunk(self, after_id=0, limit=10000):
+        """Порция пользователей по возрастанию id для потоковой выгрузки: [(id, {поле: значение}), ...]."""
+        with self.connection:
+            result = self.cursor.execute(
+                f"SELECT id, {', '.join(USER_FIELDS)} FROM users WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit)
+            ).fetchall()
+            return [(row[0], dict(zip(USER_FIELDS, row[1:]))) for row in result]
+
+    def upsert_users(self, rows):
+        """Пакетная вставка или обновление пользователей одной транзакцией. rows: кортежи в порядке USER_FIELDS.
+
+        У существующих пользователей время первого взаимодействия сохраняется, пустая дата уведомления не затирает имеющуюся.
+        UTC-слот считается один раз на сочетание (день, время, пояс) в пачке.
+        """
+        slot_fields = [USER_FIELDS.index(field) for field in ('notify_day', 'notify_time', 'timezone')]
+        slots = {}
+        params = []
+        for row in rows:
+            key = tuple(row[i] for i in slot_fields)
+            if key not in slots:
+                slots[key] = utc_slot(*key)
+            params.append((*row, slots[key]))
+        with self.connection:
+            self.cursor.executemany(f"""
+                INSERT INTO users ({', '.join(USER_FIELDS)}, utc_slot) VALUES ({', '.join('?' * (len(USER_FIELDS) + 1))})
+                ON CONFLICT (user_id) DO UPDATE SET
+                    username = excluded.username,
+                    full_name = excluded.full_name,
+                    custom_name = excluded.custom_name,
+                    birthdate = excluded.birthdate,
+                    notify_day = excluded.notify_day,
+                    notify_time = excluded.notify_time,
+                    timezone = excluded.timezone,
+                    utc_slot = excluded.utc_slot,
+                    last_notification = COALESCE(excluded.last_notification, users.last_notification),
+                    active = excluded.active
+            """, params)
+
+    def get_slots(self):
+        """Получение всех занятых UTC-слотов уведомлений активных пользователей."""
+        with self.connection:
+            result = self.cursor.execute(
+                "SELECT DISTINCT utc_slot FROM users WHERE active = 1 AND utc_slot IS NOT NULL"
+            ).fetchall()
+            return [row[0] for row in result]
+
+    def get_slot_users(self, slot, after_user_id=None, limit=-1, shard=None):
+        """Получение получателей UTC-слота уведомлений, упорядоченных по user_id.
+
+        after_user_id и limit позволяют читать большой слот порциями (keyset-пагинация по индексу слота).
+        shard=(index, count) ограничивает выборку долей пользователей одного процесса рассылки.
+        """
+        if after_user_id is None:
+            after_user_id = -2 ** 63
+        shard_clause, shard_params = self._shard_clause(shard)
+        with self.connection:
+            result = self.cursor.execute(
+                f"""
+                SELECT user_id, custom_name, birthdate, notify_day, notify_time, timezone FROM users
+                WHERE active = 1 AND utc_slot = ? AND user_id > ?{shard_clause}
+                ORDER BY user_id LIMIT ?
+                """,
+                (slot, after_user_id, *shard_params, limit)
+            ).fetchall()
+            return self._slot_recipients(result)
+
+    def get_missed_slot_users(self, slot, slot_time, after_user_id=None, limit=-1, shard=None):
+        """Получатели UTC-слота, не получившие уведомление его срабатывания slot_time (datetime во времени сервера).
+
+        Учитываются только пользователи, зарегистрированные до slot_time. Чтение порциями, как в get_slot_users.
+        """
+        if after_user_id is None:
+            after_user_id = -2 ** 63
+        shard_clause, shard_params = self._shard_clause(shard)
+        with self.connection:
+            result = self.cursor.execute(
+                f"""
+                SELECT user_id, custom_name, birthdate, notify_day, notify_time, timezone FROM users
+                WHERE active = 1 AND utc_slot = ? AND user_id > ?
+                    AND (last_notification IS NULL OR last_notification < ?) AND handshake < ?{shard_clause}
+                ORDER BY user_id LIMIT ?
+                """,
+                (slot, after_user_id, slot_time.date(), slot_time, *shard_params, limit)
+            ).fetchall()
+            return self._slot_recipients(result)
+
+    def count_slot_users(self, slot, shard=None):
+        """Число получателей UTC-слота уведомлений."""
+        shard_clause, shard_params = self._shard_clause(shard)
+        with self.connection:
+            return self.cursor.execute(
+                f"SELECT COUNT(*) FROM users WHERE active = 1 AND utc_slot = ?{shard_clause}",
+                (slot, *shard_params)
+            ).fetchone()[0]
+
+    @staticmethod
+    def _shard_clause(shard):
+        """Условие выборки доли пользователей shard=(index, count): user_id % count = index."""
+        if shard is None:
+            return "", ()
+        index, count = shard
+        return " AND user_id % ? = ?", (count, index)
+
+    @staticmethod
+    def _slot_recipients(rows):
+        return [
+            (row[0], {
+                "custom_name": row[1],
+                "birthdate": row[2],
+                "notify_day": row[3],
+                "notify_time": row[4],
+                "timezone": row[5]
+            })
+            for row in rows
+        ]
+
+    def get_fsm_record(self, chat, user):
+        """Получение состояния FSM: (state, data в JSON, updated_at) или None."""
+        with self.connection:
+            return self.cursor.execute(
+                "SELECT state, data, updated_at FROM fsm_states WHERE chat = ? AND user = ?",
+                (chat, user)
+            ).fetchone()
+
+    def save_fsm_records(self, records):
+        """Пакетное сохранение состояний FSM. records: [(chat, user, state, data, updated_at), ...]
+
+        Пустые записи (без состояния и данных) удаляются.
+        """
+        with self.connection:
+            self.cursor.executemany("""
+                INSERT INTO fsm_states (chat, user, state, data, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (chat, user) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+            """, [record for record in records if record[2] is not None or record[3] != '{}'])
+            self.cursor.executemany(
+                "DELETE FROM fsm_states WHERE chat = ? AND user = ?",
+                [record[:2] for record in records if record[2] is None and record[3] == '{}']
+            )
+
+    def count_fsm_records(self):
+        """Число сохранённых состояний FSM."""
+        with self.connection:
+            return self.cursor.execute("SELECT COUNT(*) FROM fsm_states").fetchone()[0]
+
+    def delete_stale_fsm_records(self, before):
+        """Удаление состояний FSM, не обновлявшихся с момента before (unix time). Возвращает число удалённых."""
+        with self.connection:
+            return self.cursor.execute("DELETE FROM fsm_states WHERE updated_at < ?", (before,)).rowcount
+
+    def enqueue_outbox(self, rows):
+        """Постановка уведомлений в outbox. rows: [(user_id, week, text, due_at), ...], due_at — unix time
+
+        Уведомления, уже поставленные пользователю на ту же неделю, пропускаются. Возвращает число добавленных.
+        """
+        now = time.time()
+        with self.connection:
+            return self.cursor.executemany("""
+                INSERT OR IGNORE INTO outbox (user_id, week, text, due_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+            """, [(user_id, week, text, due_at, now, now) for user_id, week, text, due_at in rows]).rowcount
+
+    def claim_outbox(self, limit, shard=None):
+        """Захват порции уведомлений, время которых наступило: pending -> claimed. Возвращает [(id, user_id, text), ...]
+
+        Захват выполняется одной транзакцией с блокировкой записи, поэтому одно уведомление не достанется двум процессам.
+        Захваченное уведомление ещё не отправляется: в sending его переводит воркер непосредственно перед отправкой.
+        """
+        shard_clause, shard_params = self._shard_clause(shard)
+        with self.connection:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            result = self.cursor.execute(
+                f"SELECT id, user_id, text FROM outbox WHERE state = 'pending' AND due_at <= ?{shard_clause} ORDER BY due_at LIMIT ?",
+                (time.time(), *shard_params, limit)
+            ).fetchall()
+            self.cursor.executemany(
+                "UPDATE outbox SET state = 'claimed', updated_at = ? WHERE id = ?",
+                [(time.time(), row[0]) for row in result]
+            )
+            return result
+
+    def start_outbox(self, outbox_id):
+        """Отметка об отправке захваченного уведомления: claimed -> sending."""
+        with self.connection:
+            self.cursor.execute(
+                "UPDATE outbox SET state = 'sending', attempts = attempts + 1, updated_at = ? WHERE id = ? AND state = 'claimed'",
+                (time.time(), outbox_id)
+            )
+
+    def finish_outbox(self, rows):
+        """Фиксация результатов отправки одной транзакцией. rows: [(id, user_id, state, date), ...]
+
+        Для доставленных (state='sent') обновляется и дата последнего уведомления пользователя.
+        Уведомления, уже возвращённые в pending, не меняются.
+        """
+        now = time.time()
+        with self.connection:
+            self.cursor.executemany(
+                "UPDATE outbox SET state = ?, updated_at = ? WHERE id = ? AND state IN ('claimed', 'sending')",
+                [(state, now, outbox_id) for outbox_id, _, state, _ in rows]
+            )
+            self.cursor.executemany(
+                "UPDATE users SET last_notification = ? WHERE user_id = ?",
+                [(date, user_id) for _, user_id, state, date in rows if state == 'sent']
+            )
+
+    def release_outbox(self, ids):
+        """Возврат захваченных, но не отправленных уведомлений в состояние pending."""
+        with self.connection:
+            self.cursor.executemany(
+                "UPDATE outbox SET state = 'pending' WHERE id = ? AND state = 'claimed'",
+                [(outbox_id,) for outbox_id in ids]
+            )
+
+    def recover_outbox(self, shard=None):
+        """Восстановление после аварийной остановки. Возвращает (возвращено в pending, помечено failed).
+
+        Захваченные, но не начатые уведомления (claimed) возвращаются в pending и будут отправлены.
+        Уведомления в sending помечаются failed: неизвестно, дошли ли они до Telegram, поэтому повторно они не отправляются.
+        """
+        shard_clause, shard_params = self._shard_clause(shard)
+        now = time.time()
+        with self.connection:
+            released = self.cursor.execute(
+                f"UPDATE outbox SET state = 'pending', updated_at = ? WHERE state = 'claimed'{shard_clause}",
+                (now, *shard_params)
+            ).rowcount
+            failed = self.cursor.execute(
+                f"UPDATE outbox SET state = 'failed', updated_at = ? WHERE state = 'sending'{shard_clause}",
+                (now, *shard_params)
+            ).rowcount
+            return released, failed
+
+    def count_outbox(self):
+        """Число уведомлений outbox по состояниям: {state: count}."""
+        with self.connection:
+            return dict(self.cursor.execute("SELECT state, COUNT(*) FROM outbox GROUP BY state").fetchall())
+
+    def delete_finished_outbox(self, before):
+        """Удаление отправленных и неудачных уведомлений, завершённых до before (unix time). Возвращает число удалённых."""
+        with self.connection:
+            return self.cursor.execute(
+                "DELETE FROM outbox WHERE state IN ('sent', 'failed') AND updated_at < ?",
+                (before,)
+            ).rowcount
+
     def delete_user(self, user_id):
         """Удаление пользователя."""
         with self.connection:
@@ -98,3 +497,139 @@ class Database:
     def close(self):
         """Закрытие соединения с базой данных."""
         self.connection.close()
+
+
+class UserCache:
+    """LRU-кэш профилей пользователей с ограничением времени жизни записей."""
+
+    MISSING = object()
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # user_id -> (время записи, профиль или None)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, user_id):
+        """Профиль из кэша, None для известного отсутствующего пользователя или MISSING."""
+        entry = self.entries.get(user_id)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self.misses += 1
+            return self.MISSING
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user_id, user_info):
+        self.entries[user_id] = (time.monotonic(), user_info)
+        self.entries.move_to_end(user_id)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        self.entries.pop(user_id, None)
+
+
+class AsyncDatabase:
+    """Асинхронный доступ к Database: запросы выполняются в выделенном потоке, не блокируя цикл событий.
+
+    Предоставляет те же методы, что и Database, но в виде корутин. Профили пользователей
+    читаются через кэш, который сбрасывается методами, изменяющими профиль.
+    """
+
+    def __init__(self, db_file, cache_size=10000, cache_ttl=300):
+        # Один поток: соединение SQLite используется только из него, запросы выполняются по очереди
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        self._db = self._executor.submit(Database, db_file).result()
+        self.cache = UserCache(cache_size, cache_ttl)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        with DB_QUERY_SECONDS.labels(func.__name__).time():
+            return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        method = getattr(self._db, name)
+        if not callable(method):
+            return method
+
+        async def wrapper(*args, **kwargs):
+            return await self._run(method, *args, **kwargs)
+
+        wrapper.__name__ = name
+        wrapper.__doc__ = method.__doc__
+        setattr(self, name, wrapper)
+        return wrapper
+
+    async def get_user_info(self, user_id):
+        """Получение информации о пользователе (через кэш)."""
+        user_info = self.cache.get(user_id)
+        if user_info is UserCache.MISSING:
+            user_info = await self._run(self._db.get_user_info, user_id)
+            self.cache.put(user_id, user_info)
+        return dict(user_info) if user_info else None
+
+    async def user_exists(self, user_id):
+        """Проверка существования пользователя (через кэш)."""
+        return await self.get_user_info(user_id) is not None
+
+    async def add_user(self, user_id, *args, **kwargs):
+        """Добавление нового пользователя."""
+        try:
+            await self._run(self._db.add_user, user_id, *args, **kwargs)
+        finally:
+            self.cache.invalidate(user_id)
+
+    async def update_user(self, user_id, *args, **kwargs):
+        """Обновление данных пользователя."""
+        try:
+            await self._run(self._db.update_user, user_id, *args, **kwargs)
+        finally:
+            self.cache.invalidate(user_id)
+
+    async def update_birthdate(self, user_id, birthdate):
+        """Обновление даты рождения пользователя."""
+        try:
+            await self._run(self._db.update_birthdate, user_id, birthdate)
+        finally:
+            self.cache.invalidate(user_id)
+
+    async def update_notification_settings(self, user_id, notify_day, notify_time):
+        """Обновление настроек уведомлений."""
+        try:
+            await self._run(self._db.update_notification_settings, user_id, notify_day, notify_time)
+        finally:
+            self.cache.invalidate(user_id)
+
+    async def activate_user(self, user_id):
+        """Возврат пользователя в рассылку. Возвращает True, если он был исключён."""
+        try:
+            return await self._run(self._db.activate_user, user_id)
+        finally:
+            self.cache.invalidate(user_id)
+
+    async def deactivate_users(self, user_ids):
+        """Исключение недоступных пользователей из рассылки."""
+        try:
+            await self._run(self._db.deactivate_users, user_ids)
+        finally:
+            for user_id in user_ids:
+                self.cache.invalidate(user_id)
+
+    async def delete_user(self, user_id):
+        """Удаление пользователя."""
+        try:
+            await self._run(self._db.delete_user, user_id)
+        finally:
+            self.cache.invalidate(user_id)
+
+    async def close(self):
+        """Закрытие соединения с базой данных и остановка потока."""
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,150 @@
+import asyncio
+import copy
+import json
+import time
+import typing
+from collections import OrderedDict
+from aiogram.dispatcher.storage import BaseStorage
+from scheduler.buffer import WriteBehindBuffer
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище состояний FSM в базе SQLite бота.
+
+    Последние записи держатся в ограниченном LRU-кэше, изменения пишутся в базу пачками.
+    Состояния, не обновлявшиеся дольше ttl секунд, считаются брошенными и удаляются.
+
+    Кэш не сверяется с базой, а запись откладывается примерно на секунду, поэтому хранилище
+    рассчитано на один процесс, принимающий обновления: несколько экземпляров с общей базой
+    видели бы устаревшие состояния друг друга.
+    """
+
+    def __init__(self, db, logger, ttl=7 * 24 * 3600, cache_size=10000, flush_interval=1.0, cleanup_interval=3600):
+        self.db = db
+        self.logger = logger
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.cleanup_interval = cleanup_interval
+        self.cache = OrderedDict()  # (chat, user) -> {'state', 'data', 'updated_at'}
+        self.pending = {}           # Записи, ещё не сброшенные в базу
+        self.writes = WriteBehindBuffer(self._flush, logger, max_size=500, interval=flush_interval)
+        self._cleanup_task = None
+
+    def start(self):
+        """Запуск фоновой записи и очистки устаревших состояний"""
+        self.writes.start()
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_periodically())
+
+    async def close(self):
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            await asyncio.gather(self._cleanup_task, return_exceptions=True)
+            self._cleanup_task = None
+        await self.writes.stop()
+        self.cache.clear()
+
+    async def wait_closed(self):
+        pass
+
+    def _key(self, chat, user):
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)
+
+    async def _load(self, key):
+        record = self.cache.get(key) or self.pending.get(key)
+        if record is None:
+            row = await self.db.get_fsm_record(*key)
+            if row:
+                record = {'state': row[0], 'data': json.loads(row[1] or '{}'), 'updated_at': row[2]}
+            else:
+                record = {'state': None, 'data': {}, 'updated_at': time.time()}
+        if time.time() - record['updated_at'] > self.ttl:
+            record = {'state': None, 'data': {}, 'updated_at': time.time()}
+
+        self.cache[key] = record
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return record
+
+    async def _save(self, key, record):
+        record['updated_at'] = time.time()
+        self.pending[key] = record
+        await self.writes.add((key, record))
+
+    async def _flush(self, rows):
+        # Несколько изменений одной записи сводятся к последнему
+        latest = dict(rows)
+        await self.db.save_fsm_records([
+            (chat, user, record['state'], json.dumps(record['data'], ensure_ascii=False), record['updated_at'])
+            for (chat, user), record in latest.items()
+        ])
+        for key, record in latest.items():
+            if self.pending.get(key) is record:
+                del self.pending[key]
+
+    async def _cleanup_periodically(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                deleted = await self.db.delete_stale_fsm_records(time.time() - self.ttl)
+                if deleted:
+                    self.logger.info(f"Удалено {deleted} устаревших состояний FSM.")
+            except Exception as e:
+                self.logger.error(f"Ошибка при очистке состояний FSM: {e}")
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        record = await self._load(self._key(chat, user))
+        return record['state'] if record['state'] is not None else self.resolve_state(default)
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        record = await self._load(self._key(chat, user))
+        return copy.deepcopy(record['data'])
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.AnyStr = None):
+        key = self._key(chat, user)
+        record = await self._load(key)
+        record['state'] = self.resolve_state(state)
+        await self._save(key, record)
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        key = self._key(chat, user)
+        record = await self._load(key)
+        record['data'] = copy.deepcopy(data or {})
+        await self._save(key, record)
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        key = self._key(chat, user)
+        record = await self._load(key)
+        record['data'].update(data or {}, **kwargs)
+        await self._save(key, record)
+
+    async def reset_state(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          with_data: typing.Optional[bool] = True):
+        key = self._key(chat, user)
+        record = await self._load(key)
+        record['state'] = None
+        if with_data:
+            record['data'] = {}
+        await self._save(key, record)
+
+    def has_bucket(self):
+        return False
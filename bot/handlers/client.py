@@ -4,9 +4,9 @@ from aiogram.dispatcher.filters import Text
 from aiogram.dispatcher.filters.state import StatesGroup, State
 from aiogram.dispatcher import FSMContext
 from datetime import datetime
-import asyncio
-from core import bot, dp, db, logger, notifier
+from core import bot, dp, db, followups, logger, notifier
 from scheduler.notifier import generate_notification_text
+from scheduler.slots import TIMEZONES, parse_timezone
 
 
 
@@ -15,6 +15,7 @@ class UserInit(StatesGroup):
     birthdate = State()         # Шаг 2: Запрос даты рождения
     notify_day = State()        # Шаг 3: Запрос дня недели для уведомлений
     notify_time = State()       # Шаг 4: Запрос времени для уведомлений
+    timezone = State()          # Шаг 5: Запрос часового пояса (можно пропустить)
 
 
 # Клавиатура для возвращения в FSM
@@ -65,12 +66,29 @@ def get_time_keyboard():
     return keyboard
 
 
+# Клавиатура для выбора часового пояса
+def get_timezone_keyboard():
+    keyboard = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    cities = list(TIMEZONES)
+    for i in range(0, len(cities), 3):
+        keyboard.row(*cities[i:i + 3])
+    keyboard.add("Пропустить")
+    keyboard.add("Назад")
+    return keyboard
+
+
 # Команда /start
 @dp.message_handler(commands=['start'])
 async def cmd_start(message: types.Message):
-    if db.user_exists(message.from_user.id):
+    user_info = await db.get_user_info(message.from_user.id)
+    if user_info:
+        # Пользователь, исключённый из рассылки как недоступный, снова написал боту — возвращаем его.
+        # Признак читается из базы, а не из кэша профиля: исключают и процессы рассылки. Запись — только для исключённых
+        if not await db.is_active(message.from_user.id) and await db.activate_user(message.from_user.id):
+            await notifier.update_user_notification(message.from_user.id, user_info['notify_day'], user_info['notify_time'], user_info['timezone'])
+            logger.info(f"Пользователь {message.from_user.id} снова доступен и возвращён в рассылку.")
+
         # Если пользователь уже зарегистрирован, выводим информацию
-        user_info = db.get_user_info(message.from_user.id)
         msg = f"""
 <b>{user_info['custom_name']}, ты когда-нибудь слышал о концепции 4000 недель?</b>
 Эта идея гласит, средняя продолжительность жизни — около 70 лет, что составляет ~4000 недель.\n
@@ -106,7 +124,7 @@ async def cmd_start(message: types.Message):
 @dp.message_handler(state=UserInit.custom_name)
 async def fsm_custom_name(message: types.Message, state: FSMContext):
     if message.text == "Назад":
-        if not db.user_exists(message.from_user.id):
+        if not await db.user_exists(message.from_user.id):
             await message.answer("<b>Используй /start для начала</b>", parse_mode='HTML', reply_markup=types.ReplyKeyboardRemove())
         else:
             await message.answer("<b>Используй /reinit для повторной настройки</b>", parse_mode='HTML', reply_markup=types.ReplyKeyboardRemove())
@@ -184,32 +202,59 @@ async def fsm_notify_time(message: types.Message, state: FSMContext):
         return
 
     await state.update_data(notify_time=notify_time.strftime("%H:%M"))  # Сохраняем в формате SQL
+    await message.answer("<b>Где ты живёшь?</b>\nВыбери город с таким же часовым поясом или напиши пояс, например UTC+3",
+                         parse_mode='HTML', reply_markup=get_timezone_keyboard())
+    await UserInit.timezone.set()
+
+
+# Обработка часового пояса
+@dp.message_handler(state=UserInit.timezone)
+async def fsm_timezone(message: types.Message, state: FSMContext):
+    if message.text == "Назад":
+        await message.answer("<b>Во сколько?</b>\nНажми на удобный час", parse_mode='HTML', reply_markup=get_time_keyboard())
+        await UserInit.notify_time.set()
+        return
+
+    # Без пояса уведомления приходят по времени сервера (у уже зарегистрированных пояс не меняется)
+    timezone = None
+    if message.text != "Пропустить":
+        timezone = parse_timezone(message.text or "")
+        if timezone is None:
+            await message.answer("Не знаю такого часового пояса. Выбери город из списка ниже или напиши пояс, например UTC+3",
+                                 parse_mode='HTML', reply_markup=get_timezone_keyboard())
+            return
 
     # Получаем все данные из состояния
     user_data = await state.get_data()
 
     try:
         # Сохраняем пользователя в базу данных
-        if not db.user_exists(message.from_user.id):
-            db.add_user(
+        user_info = await db.get_user_info(message.from_user.id)
+        if not user_info:
+            await db.add_user(
                 user_id=message.from_user.id,
                 username=message.from_user.username,
                 full_name=message.from_user.full_name,
                 custom_name=user_data['custom_name'],
                 birthdate=user_data['birthdate'],
                 notify_day=user_data['notify_day'],
-                notify_time=user_data['notify_time']
+                notify_time=user_data['notify_time'],
+                timezone=timezone
             )
             logger.info(f"Добавлен новый пользователь {message.from_user.id}")
         else:
-            db.update_user(
+            await db.update_user(
                 user_id=message.from_user.id,
                 custom_name=user_data['custom_name'],
                 birthdate=user_data['birthdate'],
                 notify_day=user_data['notify_day'],
-                notify_time=user_data['notify_time']
+                notify_time=user_data['notify_time'],
+                timezone=timezone
             )
             logger.info(f"Обновлена информация для пользователя {message.from_user.id}")
+            # Исключённый из рассылки пользователь, прошедший /reinit, снова доступен
+            if not await db.is_active(message.from_user.id) and await db.activate_user(message.from_user.id):
+                logger.info(f"Пользователь {message.from_user.id} снова доступен и возвращён в рассылку.")
 
         # Уведомление о текущей неделе
         user_info = {
@@ -218,18 +263,16 @@ async def fsm_notify_time(message: types.Message, state: FSMContext):
         }
         current_week_message = generate_notification_text(user_info)
 
-        # Обновляем задачу уведомления
+        # Обновляем задачу уведомления (слот считается по сохранённому в базе поясу)
         await notifier.update_user_notification(message.from_user.id)
 
         await message.answer(f"<b>Что-ж...</b> Буду напоминать тебе о скоротечности бытия в <b>{user_data['notify_day']} {user_data['notify_time']}</b>", 
                              parse_mode='HTML', reply_markup=types.ReplyKeyboardRemove())
-        await asyncio.sleep(2)
-
-        await message.answer('Чуть не забыл, сейчас пришлю тебе твою <b>текущую неделю</b>', parse_mode='HTML')
-        await asyncio.sleep(3)
-
-        await message.answer(current_week_message, parse_mode='HTML')
         await state.finish()
+
+        # Паузы между репликами выдерживает очередь отложенных сообщений, обработчик завершается сразу
+        followups.schedule(2, message.chat.id, 'Чуть не забыл, сейчас пришлю тебе твою <b>текущую неделю</b>', parse_mode='HTML')
+        followups.schedule(5, message.chat.id, current_week_message, parse_mode='HTML')
     except Exception as e:
         logger.error(f"Ошибка при сохранении данных пользователя {message.from_user.id}: {e}")
         await message.answer("Произошла ошибка при сохранении данных. Пожалуйста, попробуй ещё раз.")
@@ -238,7 +281,7 @@ async def fsm_notify_time(message: types.Message, state: FSMContext):
 # Команда /reinit
 @dp.message_handler(commands=['reinit'])
 async def cmd_reinit(message: types.Message):
-    if not db.user_exists(message.from_user.id):
+    if not await db.user_exists(message.from_user.id):
         await message.answer("Ты ещё не зарегистрирован. Используй /start для начала.")
         return
     
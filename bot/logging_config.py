@@ -0,0 +1,70 @@
+import atexit
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Стандартные атрибуты LogRecord; всё остальное пришло через extra и попадает в JSON отдельными полями
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: время, уровень, логгер, сообщение и поля из extra"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LocalQueueHandler(QueueHandler):
+    """QueueHandler без лишнего копирования записи: очередь не покидает процесс"""
+
+    def prepare(self, record):
+        # Аргументы подставляются сразу (объекты могут измениться, пока запись в очереди), остальное — в фоновом потоке
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_text = None
+        return record
+
+    def enqueue(self, record):
+        self.queue.put_nowait(record)
+
+
+def setup_logging(log_dir, log_file="bot.log", log_format="json", level=logging.INFO):
+    """Логирование через очередь: цикл событий только кладёт запись в очередь,
+    запись в файл (с ротацией) и в консоль выполняет фоновый поток QueueListener.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+
+    file_handler = RotatingFileHandler(
+        os.path.join(log_dir, log_file),
+        maxBytes=10 * 1024 * 1024,   # 10 MB
+        backupCount=3                # Хранить 3 backup-файла
+    )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    # Записи, оставшиеся в очереди, дописываются при завершении процесса
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [LocalQueueHandler(log_queue)]
+    root.setLevel(level)
+    return listener
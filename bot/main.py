@@ -1,13 +1,74 @@
-from core import executor, dp, logger, notifier
+import signal
+from aiohttp import web
+from core import executor, dp, bot, db, storage, followups, logger, notifier, recorder, WEBHOOK_HOST, WEBHOOK_PATH, WEBAPP_HOST, WEBAPP_PORT, METRICS_PORT, METRICS_HOST, NOTIFIER_WORKERS
+from metrics import start_metrics_server
+from supervisor import WorkerSupervisor
+
+# Процессы рассылки (если рассылка вынесена из основного процесса)
+workers = WorkerSupervisor(NOTIFIER_WORKERS, logger, METRICS_PORT) if NOTIFIER_WORKERS else None
 
 
 # Запуск планировщика уведомления (после бота)
 async def on_startup(_):
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT), METRICS_HOST)
+        logger.info(f"Метрики доступны на http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    storage.start()
+    followups.start()
+    if WEBHOOK_HOST:
+        # При перезапуске с тем же адресом вебхук не переустанавливается, чтобы не потерять накопившиеся обновления
+        url = WEBHOOK_HOST.rstrip('/') + WEBHOOK_PATH
+        info = await bot.get_webhook_info()
+        if info.url != url:
+            await bot.set_webhook(url, drop_pending_updates=True)
+            logger.info(f"Вебхук установлен: {url}")
+        else:
+            logger.info(f"Вебхук уже установлен: {url}, ожидает обновлений: {info.pending_update_count}")
     try:
         await notifier.start()
     except Exception as e:
         logger.error(f"Ошибка при запуске планировщика: {e}")
         raise
+    if workers:
+        workers.start()
+
+
+# Остановка планировщика с дорассылкой очереди уведомлений, сохранение состояний FSM, затем закрытие базы данных
+async def on_shutdown(_):
+    try:
+        await notifier.stop()
+    except Exception as e:
+        logger.error(f"Ошибка при остановке планировщика: {e}")
+    if workers:
+        await workers.stop()
+    await followups.stop()
+    await storage.close()
+    await db.close()
+    if recorder:
+        recorder.close()
+
+
+# Проверка работоспособности для балансировщика и оркестратора
+async def health(_):
+    return web.json_response({
+        'status': 'ok',
+        'notifier': notifier.enabled,
+        'queue_depth': notifier.pipeline.queue_depth,
+        'workers': workers.alive if workers else 0
+    })
+
+
+def start_webhook():
+    """Приём обновлений через вебхук (aiohttp-сервер) вместо long polling"""
+    app = web.Application()
+    app.router.add_get('/health', health)
+    webhook = executor.set_webhook(dp, WEBHOOK_PATH, on_startup=on_startup, on_shutdown=on_shutdown, web_app=app)
+    webhook.run_app(host=WEBAPP_HOST, port=WEBAPP_PORT)
+
+
+# SIGTERM (docker stop) завершает long polling так же, как Ctrl+C: executor вызывает on_shutdown
+def stop_polling(*_):
+    raise SystemExit
 
 
 # Запуск бота
@@ -15,7 +76,11 @@ if __name__ == '__main__':
     from handlers import dp
     try:
         logger.info("Бот запущен.")
-        executor.start_polling(dp, skip_updates=True, on_startup=on_startup)
+        if WEBHOOK_HOST:
+            start_webhook()
+        else:
+            signal.signal(signal.SIGTERM, stop_polling)
+            executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
         raise
\ No newline at end of file
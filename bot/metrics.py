@@ -0,0 +1,32 @@
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+
+# Границы корзин для быстрых операций (запросы к базе, обработчики)
+FAST_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+# Входящие обновления
+HANDLER_SECONDS = Histogram(
+    'bot_handler_seconds', "Время работы обработчика входящего сообщения", ['handler'], buckets=FAST_BUCKETS
+)
+THROTTLED_TOTAL = Counter('bot_throttled_total', "Входящие сообщения, отброшенные ограничением частоты", ['scope'])
+
+# База данных
+DB_QUERY_SECONDS = Histogram(
+    'bot_db_query_seconds', "Время выполнения запроса к базе данных (с ожиданием очереди потока)", ['method'], buckets=FAST_BUCKETS
+)
+
+# Отправка сообщений
+SEND_SECONDS = Histogram('bot_send_seconds', "Время вызова sendMessage", buckets=FAST_BUCKETS)
+SEND_ERRORS_TOTAL = Counter('bot_send_errors_total', "Ошибки вызова sendMessage", ['error'])
+SEND_QUEUE_DEPTH = Gauge('bot_send_queue_depth', "Сообщения, ожидающие отправки")
+NOTIFICATIONS_TOTAL = Counter('bot_notifications_total', "Итог доставки еженедельных уведомлений", ['result'])
+
+# Планировщик
+SLOT_LAG_SECONDS = Gauge('bot_slot_lag_seconds', "Опоздание запуска задачи слота относительно расписания", ['slot'])
+SLOT_MISFIRES_TOTAL = Counter('bot_slot_misfires_total', "Пропущенные запуски задач слотов", ['slot'])
+SLOT_RECIPIENTS = Gauge('bot_slot_recipients', "Число получателей при последнем срабатывании слота", ['slot'])
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Отдача метрик в текстовом формате Prometheus по адресу http://host:port/metrics"""
+    start_http_server(port, addr=host)
@@ -0,0 +1,6 @@
+from .metrics import HandlerMetrics
+from .recorder import UpdateRecorder
+from .throttling import Throttling
+
+
+__all__ = ['HandlerMetrics', 'UpdateRecorder', 'Throttling']
\ No newline at end of file
@@ -0,0 +1,19 @@
+import time
+from aiogram import types
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from metrics import HANDLER_SECONDS
+
+
+class HandlerMetrics(BaseMiddleware):
+    """Гистограмма времени работы обработчиков сообщений по именам обработчиков"""
+
+    async def on_process_message(self, message: types.Message, data: dict):
+        handler = current_handler.get()
+        data['_metrics'] = (handler.__name__ if handler else 'unknown', time.perf_counter())
+
+    async def on_post_process_message(self, message: types.Message, results, data: dict):
+        if '_metrics' not in data:
+            return
+        handler, started = data.pop('_metrics')
+        HANDLER_SECONDS.labels(handler).observe(time.perf_counter() - started)
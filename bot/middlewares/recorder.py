@@ -0,0 +1,17 @@
+import json
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+
+class UpdateRecorder(BaseMiddleware):
+    """Запись входящих обновлений в JSONL для последующего воспроизведения (benchmarks.replay)"""
+
+    def __init__(self, path):
+        super().__init__()
+        self.file = open(path, 'a', encoding='utf-8', buffering=1024 * 1024)
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        self.file.write(json.dumps(update.to_python(), ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,77 @@
+import time
+from aiogram import types
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from metrics import THROTTLED_TOTAL
+from scheduler.sender import TokenBucket
+
+THROTTLE_NOTICE = "Слишком много сообщений. Подожди немного и попробуй снова."
+
+
+class UserBucket:
+    """Токен-бакет пользователя: только необходимые поля, без __dict__"""
+    __slots__ = ('tokens', 'updated', 'notified')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+        self.notified = False  # Предупреждение об ограничении уже отправлено
+
+
+class Throttling(BaseMiddleware):
+    """Ограничение частоты входящих сообщений: токен-бакет на пользователя и общий на бота.
+
+    Проверка выполняется до фильтров и загрузки состояния FSM, поэтому отброшенное сообщение
+    не обращается ни к базе, ни к планировщику. Пользователь получает одно предупреждение за эпизод.
+    """
+
+    def __init__(self, rate=1.0, burst=5, global_rate=300, max_size=100000):
+        super().__init__()
+        self.rate = rate  # 0 — без лимита пользователя
+        self.burst = burst
+        self.global_limiter = TokenBucket(global_rate) if global_rate else None  # 0 — без общего лимита
+        self.max_size = max_size
+        self.buckets = {}  # user_id -> UserBucket
+        # За это время бакет заполняется доверху: запись простаивающего пользователя можно удалить
+        self.idle = burst / rate if rate else 0
+        self.pruned_at = time.monotonic()
+
+    def allow(self, user_id):
+        """Забрать токен пользователя. Возвращает бакет, если токенов нет, иначе None"""
+        now = time.monotonic()
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            bucket = self.buckets[user_id] = UserBucket(self.burst, now)
+            self._prune(now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+
+        if bucket.tokens < 1:
+            return bucket
+        bucket.tokens -= 1
+        bucket.notified = False
+        return None
+
+    def _prune(self, now):
+        # Удаляем простаивающих пользователей, чтобы словарь не рос с числом пользователей бота
+        if len(self.buckets) > self.max_size and now - self.pruned_at > self.idle:
+            self.pruned_at = now
+            self.buckets = {k: v for k, v in self.buckets.items() if now - v.updated < self.idle}
+
+    async def on_pre_process_message(self, message: types.Message, data: dict):
+        if message.from_user is None:
+            return
+
+        # Сначала лимит пользователя: флуд одного пользователя не расходует общий лимит
+        bucket = self.allow(message.from_user.id) if self.rate else None
+        if bucket is not None:
+            THROTTLED_TOTAL.labels('user').inc()
+            if not bucket.notified:
+                bucket.notified = True
+                await message.answer(THROTTLE_NOTICE)
+            raise CancelHandler()
+
+        if self.global_limiter and not self.global_limiter.try_acquire():
+            THROTTLED_TOTAL.labels('global').inc()
+            raise CancelHandler()
@@ -0,0 +1,54 @@
+import asyncio
+
+
+class WriteBehindBuffer:
+    """Буфер отложенной записи: копит строки и сбрасывает их в базу одной транзакцией по размеру или по таймеру"""
+
+    def __init__(self, flush, logger, max_size=1000, interval=5.0):
+        self.flush_func = flush  # Корутина, принимающая список строк
+        self.logger = logger
+        self.max_size = max_size
+        self.interval = interval
+        self.rows = []
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def start(self):
+        """Запуск периодического сброса буфера"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """Остановка таймера и финальный сброс буфера"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def add(self, row):
+        """Добавление строки в буфер. При переполнении буфер сбрасывается сразу"""
+        self.rows.append(row)
+        if len(self.rows) >= self.max_size:
+            await self.flush()
+
+    async def flush(self):
+        """Запись накопленных строк в базу"""
+        async with self._lock:
+            if not self.rows:
+                return
+            rows, self.rows = self.rows, []
+            try:
+                await self.flush_func(rows)
+            except Exception as e:
+                # Возвращаем строки в буфер, чтобы записать их при следующем сбросе
+                self.rows[:0] = rows
+                self.logger.error(f"Ошибка при записи буфера ({len(rows)} строк): {e}")
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
@@ -0,0 +1,69 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class DelayedQueue:
+    """Отложенные сообщения: куча таймеров, которую разбирает одна задача.
+
+    Обработчик ставит сообщение с задержкой и сразу завершается, вместо того чтобы ждать в asyncio.sleep.
+    """
+
+    def __init__(self, bot, logger):
+        self.bot = bot
+        self.logger = logger
+        self.heap = []  # (время отправки по time.monotonic, порядковый номер, chat_id, text, kwargs)
+        self._counter = itertools.count()  # При равном времени сообщения уходят в порядке постановки
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._sending = set()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def start(self):
+        """Запуск задачи, разбирающей очередь"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._drain())
+
+    async def stop(self):
+        """Остановка: оставшиеся сообщения отправляются сразу, не дожидаясь своего времени"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self.heap:
+            _, _, chat_id, text, kwargs = heapq.heappop(self.heap)
+            await self._send(chat_id, text, kwargs)
+        await asyncio.gather(*self._sending, return_exceptions=True)
+
+    def schedule(self, delay, chat_id, text, **kwargs):
+        """Отправка сообщения text в чат chat_id через delay секунд. kwargs передаются в send_message"""
+        heapq.heappush(self.heap, (time.monotonic() + delay, next(self._counter), chat_id, text, kwargs))
+        self._wakeup.set()
+
+    async def _drain(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self.heap and self.heap[0][0] <= now:
+                _, _, chat_id, text, kwargs = heapq.heappop(self.heap)
+                # Медленный ответ Telegram одному чату не задерживает остальные
+                task = asyncio.create_task(self._send(chat_id, text, kwargs))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+
+            # asyncio.wait, а не wait_for: wait_for теряет отмену, если событие наступило одновременно с ней
+            timeout = self.heap[0][0] - now if self.heap else None
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=timeout)
+            finally:
+                waiter.cancel()
+
+    async def _send(self, chat_id, text, kwargs):
+        try:
+            await self.bot.send_message(chat_id, text, **kwargs)
+        except Exception as e:
+            self.logger.error(f"Ошибка при отправке отложенного сообщения {chat_id}: {e}")
@@ -1,8 +1,52 @@
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_MISSED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import asyncio
 import random
+import time
+import numpy as np
 from .misc import phrases
+from .sender import SendPipeline, is_permanent_error
+from .buffer import WriteBehindBuffer
+from .outbox import Outbox, week_key
+from .slots import CRON_DAYS, WEEK_MINUTES, local_date, previous_slot_time, slot_job_id, utc_slot
+from metrics import NOTIFICATIONS_TOTAL, SLOT_LAG_SECONDS, SLOT_MISFIRES_TOTAL, SLOT_RECIPIENTS
+
+
+TOTAL_WEEKS = 4000
+NOTIFICATION_TEMPLATE = "<b>{}</b>, сегодня ты прожил(а) свою <b>{}</b> неделю из <b>{}</b>.\n<i>{}</i>"
+
+# За сколько минут до срабатывания слота готовить тексты уведомлений
+PRERENDER_LEAD_MINUTES = 5
+
+# Насколько поздно задача слота ещё запускается (остановка цикла событий, перегрузка), а не пропускается на неделю.
+# Опоздавшие запуски одной задачи схлопываются в один
+SLOT_MISFIRE_GRACE_MINUTES = 60
+
+# Размер порции получателей, читаемой из базы за один запрос
+SLOT_CHUNK_SIZE = 5000
+
+# Догон пропущенных при простое уведомлений: скорость (сообщений/с) и максимальное опоздание
+CATCHUP_RATE = 10
+CATCHUP_MAX_AGE = timedelta(hours=12)
+
+# Период сверки задач слотов с базой (слоты могут появиться из другого процесса)
+SLOT_SYNC_MINUTES = 1
+
+# Рассылка слота растягивается на окно, чтобы не отправлять всё в первые секунды часа. Окно пропорционально
+# числу получателей (средняя скорость — SPREAD_RATE_SHARE от лимита отправки), но не длиннее SLOT_SPREAD_WINDOW
+SLOT_SPREAD_WINDOW = timedelta(minutes=10)
+SPREAD_RATE_SHARE = 0.5
+
+# Период пересчёта UTC-слотов: после перехода на летнее или зимнее время локальное время уведомления
+# приходится на другой UTC-слот. Пересчёт достаточно выполнить в любой момент между срабатываниями слота
+SLOT_REFRESH_MINUTES = 60
+
+
+def spread_offset(user_id):
+    """Доля окна рассылки, через которую пользователь получает уведомление: [0, 1), одна и та же каждую неделю"""
+    # Мультипликативный хеш Кнута: соседние user_id разносятся по всему окну
+    return user_id * 2654435761 % 2 ** 32 / 2 ** 32
 
 
 def generate_notification_text(user_info):
@@ -14,113 +58,377 @@ def generate_notification_text(user_info):
     delta = today - birthdate
     
     weeks_lived = delta.days // 7
-    total_weeks = 4000
 
     # Выбор случайной фразы
     random_phrase = random.choice(phrases)
 
-    return f"<b>{custom_name}</b>, сегодня ты прожил(а) свою <b>{weeks_lived}</b> неделю из <b>{total_weeks}</b>.\n<i>{random_phrase}</i>"
+    return NOTIFICATION_TEMPLATE.format(custom_name, weeks_lived, TOTAL_WEEKS, random_phrase)
+
+
+def local_dates(users_info, moment):
+    """Даты пользователей в их часовых поясах в момент moment: пояс переводится один раз на всех его пользователей"""
+    dates = {}
+    for user_info in users_info:
+        if user_info['timezone'] not in dates:
+            dates[user_info['timezone']] = local_date(user_info['timezone'], moment)
+    return [dates[user_info['timezone']] for user_info in users_info]
+
+
+def render_notification_texts(users_info, today=None):
+    """Пакетная генерация текстов уведомлений: недели считаются одним векторным проходом.
+
+    today — дата или список дат по одной на пользователя (у каждого своя дата в его часовом поясе).
+    """
+    if not users_info:
+        return []
+    today = np.asarray(datetime.now().date() if today is None else today, dtype='datetime64[D]')
+
+    birthdates = np.array([user_info['birthdate'] for user_info in users_info], dtype='datetime64[D]')
+    weeks_lived = ((today - birthdates).astype(np.int64) // 7).tolist()
+    phrase_ids = np.random.randint(len(phrases), size=len(users_info)).tolist()
+
+    return [
+        NOTIFICATION_TEMPLATE.format(user_info['custom_name'], weeks, TOTAL_WEEKS, phrases[phrase_id])
+        for user_info, weeks, phrase_id in zip(users_info, weeks_lived, phrase_ids)
+    ]
 
 
 class Notifier:
-    def __init__(self, bot, db, logger, scheduler: AsyncIOScheduler):
+    def __init__(self, bot, db, logger, scheduler: AsyncIOScheduler, pipeline: SendPipeline = None, enabled=True,
+                 catchup_rate=CATCHUP_RATE, catchup_max_age=CATCHUP_MAX_AGE, shard=None, spread_window=SLOT_SPREAD_WINDOW):
         self.bot = bot
         self.db = db
         self.logger = logger
         self.scheduler = scheduler
+        self.pipeline = pipeline or SendPipeline(bot, logger)
+        # Уведомления ставятся в outbox и переживают перезапуск; outbox передаёт их конвейеру порциями
+        self.outbox = Outbox(db, self.pipeline, logger, self._on_delivered, self._on_failed, shard)
+        # Результаты доставки пишутся в базу (и в лог) пачками, а не на каждое сообщение
+        self.delivered = WriteBehindBuffer(self._finish_deliveries, logger)
+        # Недоступные пользователи исключаются из рассылки тоже пачками
+        self.unreachable = WriteBehindBuffer(self._deactivate_users, logger)
+        self.slot_jobs = {}  # Реестр задач слотов: id задачи -> задача
+        self.prerendered = {}  # id задачи слота -> {(user_id, custom_name, birthdate): текст}
+        self.catchup_rate = catchup_rate
+        self.catchup_max_age = catchup_max_age
+        self.spread_window = spread_window
+        self.enabled = enabled  # False — процесс только принимает обновления, рассылкой занимается другой
+        self.shard = shard  # (index, count): процесс рассылает только пользователям с user_id % count == index
+        self._startup_task = None
 
     async def start(self):
         """Запуск планировщика уведомлений"""
+        if not self.enabled:
+            self.logger.info("Рассылка уведомлений в этом процессе отключена.")
+            return
         if not self.scheduler.running:
+            self.scheduler.add_listener(self._on_job_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
             self.scheduler.start()
-            self.logger.info("Планировщик уведомлений запущен.")
+            self.logger.info("Планировщик уведомлений запущен." if self.shard is None else
+                             f"Планировщик уведомлений запущен (доля {self.shard[0]} из {self.shard[1]}).")
             await asyncio.sleep(0.1)
-        await self.schedule_notifications()
+        self.pipeline.start()
+        self.delivered.start()
+        self.unreachable.start()
+        await self.outbox.start()
+        # Планирование идёт в фоне, чтобы бот начал обрабатывать обновления сразу
+        self._startup_task = asyncio.create_task(self._schedule_in_background())
 
-    async def send_notification(self, user_id):
-        """Отправка уведомления пользователю"""
-        user_info = self.db.get_user_info(user_id)
+    async def _schedule_in_background(self):
+        try:
+            # Слоты пользователей, записанных до появления часовых поясов, и слоты, устаревшие за время простоя
+            await self.refresh_slots()
+            await self.schedule_notifications()
+        except Exception as e:
+            self.logger.error(f"Ошибка при планировании уведомлений: {e}")
+        if not self.slot_jobs:
+            self.logger.warning("Нет пользователей для планирования уведомлений.")
 
-        if not user_info:
-            self.logger.warning(f"Пользователь {user_id} не найден в базе данных.")
-            return
-        message_text = generate_notification_text(user_info)
+        # Периодическая сверка подхватывает слоты, созданные другими процессами. Задачи регистрируются до догона:
+        # он идёт с ограниченной скоростью и может занять часы
+        self.scheduler.add_job(
+            self.schedule_notifications,
+            'interval',
+            id="sync_slots",
+            minutes=SLOT_SYNC_MINUTES,
+            replace_existing=True
+        )
+        self.scheduler.add_job(
+            self.refresh_slots,
+            'interval',
+            id="refresh_slots",
+            minutes=SLOT_REFRESH_MINUTES,
+            replace_existing=True
+        )
 
         try:
-            await self.bot.send_message(user_id, message_text, parse_mode='HTML')
-            self.db.update_last_notification(user_id, datetime.now().date())
-            self.logger.info(f"Уведомление отправлено пользователю {user_id}.")
-            
+            await self.catch_up_missed()
         except Exception as e:
-            self.logger.error(f"Ошибка при отправке уведомления пользователю {user_id}: {e}")
+            self.logger.error(f"Ошибка при догоне пропущенных уведомлений: {e}")
 
-    async def update_user_notification(self, user_id):
-        """Обновление задачи уведомления для пользователя"""
-        if not self.scheduler.running:
-            self.logger.critical("Планировщик не запущен! Задачи обновлены не будут.")
+    async def stop(self):
+        """Остановка планировщика с дорассылкой поставленных в очередь уведомлений"""
+        if self._startup_task and not self._startup_task.done():
+            self._startup_task.cancel()
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        await self.outbox.stop()
+        await self.pipeline.stop()
+        await self.delivered.stop()
+        await self.unreachable.stop()
+        self.logger.info("Планировщик уведомлений остановлен.")
+
+    def _on_job_event(self, event):
+        """Метрики задержки и пропусков запуска задач слотов"""
+        if not event.job_id.startswith("slot_"):
+            return
+        if event.code == EVENT_JOB_MISSED:
+            SLOT_MISFIRES_TOTAL.labels(event.job_id).inc()
+            self.logger.warning(f"Пропущен запуск задачи {event.job_id}.")
             return
+        scheduled = event.scheduled_run_times[-1]
+        SLOT_LAG_SECONDS.labels(event.job_id).set((datetime.now(scheduled.tzinfo) - scheduled).total_seconds())
 
-        # Удаляем старую задачу (если есть)
-        for job in self.scheduler.get_jobs():
-            if job.args and job.args[0] == user_id:
-                job.remove()
-                self.logger.info(f"Старая задача уведомления для пользователя {user_id} удалена.")
+    async def _on_delivered(self, outbox_id, user_id):
+        """Обработка успешной доставки уведомления"""
+        NOTIFICATIONS_TOTAL.labels('sent').inc()
+        await self.delivered.add((outbox_id, user_id, 'sent', datetime.now().date()))
+        self.logger.debug("Уведомление отправлено пользователю %s.", user_id)
 
-        # Получаем данные пользователя
-        user_info = self.db.get_user_info(user_id)
-        if not user_info:
-            self.logger.warning(f"Данные пользователя {user_id} не найдены.")
+    async def _on_failed(self, outbox_id, user_id, error):
+        """Обработка неудачной доставки уведомления. Недоступные навсегда пользователи исключаются из рассылки"""
+        await self.delivered.add((outbox_id, user_id, 'failed', None))
+        if is_permanent_error(error):
+            NOTIFICATIONS_TOTAL.labels('unreachable').inc()
+            await self.unreachable.add(user_id)
+            self.logger.debug("Пользователь %s недоступен: %s.", user_id, error)
             return
+        NOTIFICATIONS_TOTAL.labels('failed').inc()
+        self.logger.error(f"Ошибка при отправке уведомления пользователю {user_id}: {error}")
 
-        # Получаем день недели и время уведомления
-        notify_day = user_info['notify_day']
-        notify_time = user_info['notify_time']
+    async def _finish_deliveries(self, rows):
+        """Запись результатов доставки и одна сводная строка в лог на пачку вместо строки на сообщение"""
+        await self.db.finish_outbox(rows)
+        sent = sum(state == 'sent' for _, _, state, _ in rows)
+        self.logger.info(f"Уведомлений отправлено: {sent}, не доставлено: {len(rows) - sent}.",
+                         extra={'sent': sent, 'failed': len(rows) - sent})
 
-        # Преобразуем день недели в формат, понятный для cron
-        days_map = {
-            "Пн": "mon", 
-            "Вт": "tue",
-            "Ср": "wed",
-            "Чт": "thu",
-            "Пт": "fri",
-            "Сб": "sat",
-            "Вс": "sun"
-        }
-        day_of_week = days_map.get(notify_day, "mon")  # По-умолчанию понедельник
+    async def _deactivate_users(self, user_ids):
+        await self.db.deactivate_users(user_ids)
+        self.logger.warning(f"Исключено из рассылки недоступных пользователей: {len(user_ids)}.",
+                            extra={'unreachable': len(user_ids)})
 
-        # Преобразуем время уведомления в объект времени
-        notify_time_obj = datetime.strptime(notify_time, "%H:%M").time()
+    async def iter_slot_recipients(self, slot, chunk_size=SLOT_CHUNK_SIZE, missed_at=None):
+        """Потоковое чтение получателей UTC-слота порциями по chunk_size.
 
+        С missed_at — только пользователи, не получившие уведомление срабатывания missed_at.
+        """
+        after_user_id = None
+        while True:
+            if missed_at:
+                chunk = await self.db.get_missed_slot_users(slot, missed_at, after_user_id, chunk_size, self.shard)
+            else:
+                chunk = await self.db.get_slot_users(slot, after_user_id, chunk_size, self.shard)
+            if not chunk:
+                return
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            after_user_id = chunk[-1][0]
 
-        ## Планируем новую задачу
+    async def prerender_slot(self, slot):
+        """Подготовка текстов уведомлений слота заранее, до его срабатывания"""
+        job_id = slot_job_id(slot)
+        job = self.slot_jobs.get(job_id)
+        if not job:
+            return
+
+        # Недели считаются на дату срабатывания слота в поясе каждого пользователя, а не на текущую
+        prerendered = {}
+        async for recipients in self.iter_slot_recipients(slot):
+            users_info = [user_info for _, user_info in recipients]
+            texts = render_notification_texts(users_info, local_dates(users_info, job.next_run_time))
+            prerendered.update(
+                ((user_id, user_info['custom_name'], user_info['birthdate']), text)
+                for (user_id, user_info), text in zip(recipients, texts)
+            )
+        if prerendered:
+            self.prerendered[job_id] = prerendered
+            self.logger.info(f"Слот {job_id}: подготовлено {len(prerendered)} текстов уведомлений.")
+
+    def slot_spread_seconds(self, recipients):
+        """Окно рассылки слота: время отправки recipients уведомлений на доле лимита, но не больше spread_window"""
+        rate = self.pipeline.global_limiter.rate * SPREAD_RATE_SHARE
+        return min(self.spread_window.total_seconds(), recipients / rate)
+
+    async def dispatch_slot(self, slot):
+        """Рассылка уведомлений всем пользователям UTC-слота: у каждого это его локальные день и час.
+
+        Уведомления распределяются по окну рассылки: каждый пользователь получает своё со стабильным сдвигом.
+        """
+        job_id = slot_job_id(slot)
+        prerendered = self.prerendered.pop(job_id, {})
+        moment = datetime.now(timezone.utc)
+        started = time.time()
+        window = self.slot_spread_seconds(await self.db.count_slot_users(slot, self.shard))
+        total = added = 0
+
+        async for recipients in self.iter_slot_recipients(slot):
+            # Неделя и текст считаются по дате пользователя в его часовом поясе
+            dates = local_dates([user_info for _, user_info in recipients], moment)
+            weeks = {day: week_key(day) for day in set(dates)}
+
+            # Тексты для пользователей, изменивших профиль после подготовки, генерируются сейчас
+            texts = [prerendered.get((user_id, user_info['custom_name'], user_info['birthdate'])) for user_id, user_info in recipients]
+            missing = [i for i, text in enumerate(texts) if text is None]
+            rendered = render_notification_texts([recipients[i][1] for i in missing], [dates[i] for i in missing])
+            for i, text in zip(missing, rendered):
+                texts[i] = text
+
+            # Пользователи, уже получившие уведомление на этой неделе, outbox пропускает
+            added += await self.outbox.enqueue([
+                (user_id, weeks[day], text, started + spread_offset(user_id) * window)
+                for (user_id, _), day, text in zip(recipients, dates, texts)
+            ])
+            total += len(recipients)
+
+        SLOT_RECIPIENTS.labels(job_id).set(total)
+        if total:
+            self.logger.info(f"Слот {job_id}: в outbox поставлено {added} из {total} уведомлений на {window:.0f} с.",
+                             extra={'slot': job_id, 'queued': added, 'recipients': total, 'window': window})
+
+    async def catch_up_missed(self, now=None):
+        """Отправка уведомлений слотов, сработавших, пока бот был остановлен.
+
+        Для каждого слота берётся его последнее срабатывание; пока оно не старше catchup_max_age,
+        получатели без уведомления за этот день ставятся в outbox с ограниченной скоростью.
+        """
+        now = now or datetime.now(timezone.utc)
+        started = time.monotonic()
+        chunk_size = max(1, int(self.catchup_rate))
+        total = 0
+
+        for slot in await self.db.get_slots():
+            slot_time = previous_slot_time(slot, now)
+            if now - slot_time > self.catchup_max_age:
+                continue
+
+            # Даты последних уведомлений и время регистрации в базе записаны во времени сервера
+            missed_at = slot_time.astimezone().replace(tzinfo=None)
+            added = 0
+            async for recipients in self.iter_slot_recipients(slot, chunk_size, missed_at=missed_at):
+                # Догон большого слота длится долго: срабатывание может устареть посреди него
+                if now + timedelta(seconds=time.monotonic() - started) - slot_time > self.catchup_max_age:
+                    self.logger.warning(f"Догон слота {slot_job_id(slot)} прерван: срабатывание старше {self.catchup_max_age}.")
+                    break
+                users_info = [user_info for _, user_info in recipients]
+                dates = local_dates(users_info, slot_time)
+                texts = render_notification_texts(users_info, dates)
+                added += await self.outbox.enqueue([
+                    (user_id, week_key(day), text, time.time())
+                    for (user_id, _), day, text in zip(recipients, dates, texts)
+                ])
+                # Порция в секунду, чтобы догон не вытеснял рассылку текущих слотов
+                await asyncio.sleep(len(recipients) / self.catchup_rate)
+            if added:
+                self.logger.info(f"Догон слота {slot_job_id(slot)}: в outbox поставлено {added} уведомлений.")
+            total += added
+
+        if total:
+            self.logger.info(f"Догон пропущенных уведомлений завершён: {total} уведомлений.")
+
+    def _ensure_slot_job(self, slot):
+        """Регистрация задачи UTC-слота, если её ещё нет. Возвращает True для нового слота"""
+        job_id = slot_job_id(slot)
+        if job_id in self.slot_jobs:
+            return False
+
+        ## Одна задача на слот вместо задачи на каждого пользователя. Слоты хранятся в UTC, поэтому и cron в UTC
+        self.slot_jobs[job_id] = self.scheduler.add_job(
+            self.dispatch_slot,
+            'cron',
+            id=job_id,
+            day_of_week=CRON_DAYS[slot // 1440],
+            hour=slot % 1440 // 60,
+            minute=slot % 60,
+            timezone=timezone.utc,
+            args=[slot],
+            misfire_grace_time=SLOT_MISFIRE_GRACE_MINUTES * 60,
+            coalesce=True,
+            replace_existing=True
+        )
+
+        # Подготовка текстов за PRERENDER_LEAD_MINUTES минут до слота (с переходом через полночь и неделю)
+        prerender_at = (slot - PRERENDER_LEAD_MINUTES) % WEEK_MINUTES
         self.scheduler.add_job(
-            self.send_notification,
+            self.prerender_slot,
             'cron',
-            day_of_week=day_of_week,
-            hour=notify_time_obj.hour,
-            minute=notify_time_obj.minute,
-            args=[user_id]
+            id=f"prerender_{job_id}",
+            day_of_week=CRON_DAYS[prerender_at // 1440],
+            hour=prerender_at % 1440 // 60,
+            minute=prerender_at % 60,
+            timezone=timezone.utc,
+            args=[slot],
+            # Подготовка, опоздавшая к срабатыванию слота, бесполезна
+            misfire_grace_time=PRERENDER_LEAD_MINUTES * 60,
+            coalesce=True,
+            replace_existing=True
         )
-        
+
         ## Для дебагинга планировщика уведомлений
         # self.scheduler.add_job(
-        #     self.send_notification,
+        #     self.dispatch_slot,
         #     'interval',
         #     minutes=1,
-        #     args=[user_id]
+        #     args=[slot]
         # )
 
-        self.logger.info(f"Новая задача уведомления для пользователя {user_id} запланирована.")
+        self.logger.info(f"Задача слота {job_id} (UTC) запланирована.")
+        return True
 
-    async def schedule_notifications(self):
-        """Планирование уведомлений для всех пользователей"""
-        users = self.db.get_all_users()
+    def _remove_slot_job(self, job_id):
+        """Снятие задачи слота, в котором не осталось пользователей (например, после перехода на летнее время)"""
+        self.slot_jobs.pop(job_id).remove()
+        self.prerendered.pop(job_id, None)
+        job = self.scheduler.get_job(f"prerender_{job_id}")
+        if job:
+            job.remove()
 
-        if not users:
-            self.logger.warning("Нет пользователей для планирования уведомлений.")
+    async def update_user_notification(self, user_id, notify_day=None, notify_time=None, tz_name=None):
+        """Обновление задачи уведомления для пользователя"""
+        if not self.enabled:
+            return  # Слот подхватит процесс рассылки при очередной сверке
+        if not self.scheduler.running:
+            self.logger.critical("Планировщик не запущен! Задачи обновлены не будут.")
             return
-        
-        for user_id in users:
-            await self.update_user_notification(user_id)
-        
-        self.logger.info(f"Уведомления запланированы для {len(users)} пользователей.")
+
+        # Получаем данные пользователя, если слот не передан явно
+        if notify_day is None or notify_time is None:
+            user_info = await self.db.get_user_info(user_id)
+            if not user_info:
+                self.logger.warning(f"Данные пользователя {user_id} не найдены.")
+                return
+            notify_day, notify_time, tz_name = user_info['notify_day'], user_info['notify_time'], user_info['timezone']
+
+        # Пользователь попадает в свой слот автоматически: слот выбирает получателей из базы при срабатывании
+        self._ensure_slot_job(utc_slot(notify_day, notify_time, tz_name))
+        self.logger.info(f"Уведомления для пользователя {user_id} назначены на {notify_day} {notify_time} ({tz_name or 'пояс сервера'}).")
+
+    async def schedule_notifications(self):
+        """Планирование уведомлений для всех пользователей за один проход. Задачи опустевших слотов снимаются"""
+        slots = await self.db.get_slots()
+
+        added = sum(self._ensure_slot_job(slot) for slot in slots)
+        current = {slot_job_id(slot) for slot in slots}
+        stale = [job_id for job_id in self.slot_jobs if job_id not in current]
+        for job_id in stale:
+            self._remove_slot_job(job_id)
+        if added or stale:
+            self.logger.info(f"Уведомления запланированы: {added} новых слотов, снято {len(stale)}, всего {len(self.slot_jobs)}.")
+
+    async def refresh_slots(self):
+        """Пересчёт UTC-слотов пользователей после перехода на летнее или зимнее время и сверка задач слотов"""
+        changed = await self.db.refresh_utc_slots()
+        if changed:
+            self.logger.info(f"UTC-слоты пересчитаны: изменён слот {changed} пользователей.", extra={'changed': changed})
+            await self.schedule_notifications()
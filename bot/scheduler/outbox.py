@@ -0,0 +1,136 @@
+import asyncio
+import time
+from functools import partial
+
+
+def week_key(date):
+    """Ключ идемпотентности уведомления: ISO-неделя даты, например '2024-W07'"""
+    year, week, _ = date.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class Outbox:
+    """Доставка уведомлений из таблицы outbox.
+
+    Уведомления захватываются из базы порциями (pending -> claimed) и передаются конвейеру отправки;
+    в sending уведомление переходит, когда воркер конвейера начинает его отправку.
+    Результат (sent/failed) передаётся колбэкам on_sent(outbox_id, user_id) и on_failed(outbox_id, user_id, error).
+    Если перевести уведомление в sending не удалось, оно возвращается в pending.
+    Новые порции захватываются, только пока очередь конвейера не превышает high_watermark.
+    С shard=(index, count) захватываются только уведомления пользователей с user_id % count == index.
+    """
+
+    def __init__(self, db, pipeline, logger, on_sent, on_failed, shard=None, batch_size=500, high_watermark=1000,
+                 poll_interval=1.0, retention=14 * 24 * 3600, cleanup_interval=3600):
+        self.db = db
+        self.pipeline = pipeline
+        self.logger = logger
+        self.on_sent = on_sent
+        self.on_failed = on_failed
+        self.shard = shard
+        self.batch_size = batch_size
+        self.high_watermark = high_watermark
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.cleanup_interval = cleanup_interval
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    async def start(self):
+        """Восстановление после аварийной остановки и запуск захвата уведомлений"""
+        if self._tasks:
+            return
+        released, failed = await self.db.recover_outbox(self.shard)
+        if released:
+            self.logger.info(f"Outbox: {released} захваченных, но не отправленных уведомлений возвращены в очередь.")
+        if failed:
+            self.logger.warning(f"Outbox: {failed} уведомлений с неизвестным исходом помечены как неудачные.")
+        self._tasks = [
+            asyncio.create_task(self._claim_loop()),
+            asyncio.create_task(self._cleanup_periodically()),
+        ]
+
+    async def stop(self):
+        """Остановка захвата. Уже захваченные уведомления дорассылает конвейер"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, rows):
+        """Постановка уведомлений в outbox. rows: [(user_id, week, text, due_at), ...], due_at — unix time
+
+        Уведомления, уже поставленные пользователю на ту же неделю, пропускаются. Возвращает число добавленных.
+        """
+        added = await self.db.enqueue_outbox(rows)
+        if added:
+            self._wakeup.set()
+        return added
+
+    async def _claim_loop(self):
+        while True:
+            if self.pipeline.queue_depth >= self.high_watermark:
+                await asyncio.sleep(0.1)
+                continue
+
+            self._wakeup.clear()
+            try:
+                batch = await self._claim()
+            except Exception as e:
+                self.logger.error(f"Ошибка при захвате уведомлений из outbox: {e}")
+                batch = []
+
+            if not batch:
+                # Ждём новых уведомлений из этого процесса или опрашиваем базу (их мог добавить другой процесс).
+                # asyncio.wait, а не wait_for: wait_for теряет отмену, если событие наступило одновременно с ней
+                waiter = asyncio.ensure_future(self._wakeup.wait())
+                try:
+                    await asyncio.wait({waiter}, timeout=self.poll_interval)
+                finally:
+                    waiter.cancel()
+                continue
+
+            for i, (outbox_id, user_id, text) in enumerate(batch):
+                try:
+                    await self.pipeline.submit(
+                        user_id, text,
+                        partial(self.on_sent, outbox_id),
+                        partial(self.on_failed, outbox_id),
+                        partial(self._on_start, outbox_id)
+                    )
+                except asyncio.CancelledError:
+                    # Остановка посреди порции: не переданные конвейеру уведомления возвращаются в pending
+                    await self.db.release_outbox([row[0] for row in batch[i:]])
+                    raise
+
+    async def _claim(self):
+        """Захват порции. Отмена не теряет порцию: захват в потоке базы дожидается завершения и возвращается в pending"""
+        claim = asyncio.ensure_future(self.db.claim_outbox(self.batch_size, self.shard))
+        try:
+            return await asyncio.shield(claim)
+        except asyncio.CancelledError:
+            try:
+                batch = await claim
+                if batch:
+                    await self.db.release_outbox([row[0] for row in batch])
+            except Exception as e:
+                self.logger.error(f"Ошибка при возврате захваченных уведомлений в outbox: {e}")
+            raise
+
+    async def _on_start(self, outbox_id, user_id):
+        try:
+            await self.db.start_outbox(outbox_id)
+        except Exception:
+            # Отправка ещё не начиналась: уведомление возвращается в pending и будет захвачено снова
+            await self.db.release_outbox([outbox_id])
+            raise
+
+    async def _cleanup_periodically(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                deleted = await self.db.delete_finished_outbox(time.time() - self.retention)
+                if deleted:
+                    self.logger.info(f"Outbox: удалено {deleted} завершённых уведомлений.")
+            except Exception as e:
+                self.logger.error(f"Ошибка при очистке outbox: {e}")
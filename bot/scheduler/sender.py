@@ -0,0 +1,185 @@
+import asyncio
+import time
+from aiogram.utils.exceptions import (RetryAfter, NetworkError, RestartingTelegram, TelegramAPIError,
+                                      BotBlocked, BotKicked, UserDeactivated, ChatNotFound,
+                                      CantInitiateConversation, CantTalkWithBots)
+from metrics import SEND_SECONDS, SEND_ERRORS_TOTAL
+
+# Ошибки, после которых писать пользователю бесполезно: бот заблокирован, аккаунт удалён, чат недоступен
+PERMANENT_ERRORS = (BotBlocked, BotKicked, UserDeactivated, ChatNotFound, CantInitiateConversation, CantTalkWithBots)
+
+
+def is_permanent_error(error):
+    """Недоступен ли получатель навсегда (в отличие от временных сбоев сети и Telegram)"""
+    return isinstance(error, PERMANENT_ERRORS)
+
+
+class TokenBucket:
+    """Токен-бакет: не более rate операций в секунду с запасом capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        # Не меньше одного токена: иначе при rate < 1 (SEND_RATE на несколько процессов) бакет не наполнится никогда
+        self.capacity = max(1.0, capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """Забрать токен без ожидания. Возвращает False, если токенов нет"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        """Дождаться и забрать токен"""
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ChatLimiter:
+    """Ограничение частоты сообщений в один чат (Telegram: ~1 сообщение в секунду)"""
+
+    def __init__(self, interval=1.0, max_size=10000):
+        self.interval = interval
+        self.max_size = max_size
+        self.next_allowed = {}  # chat_id -> время, раньше которого писать нельзя
+        self.pruned_at = time.monotonic()
+
+    async def acquire(self, chat_id):
+        now = time.monotonic()
+        allowed_at = self.next_allowed.get(chat_id, now)
+        self.next_allowed[chat_id] = max(allowed_at, now) + self.interval
+
+        # Чистим устаревшие записи, чтобы словарь не рос вместе с числом получателей
+        if len(self.next_allowed) > self.max_size and now - self.pruned_at > self.interval:
+            self.pruned_at = now
+            self.next_allowed = {k: v for k, v in self.next_allowed.items() if v > now}
+
+        if allowed_at > now:
+            await asyncio.sleep(allowed_at - now)
+
+
+class SendPipeline:
+    """Конвейер отправки сообщений: пул воркеров, глобальный и початовый лимиты, обработка flood control"""
+
+    def __init__(self, bot, logger, workers=8, rate=25, per_chat_interval=1.0,
+                 queue_size=10000, max_retries=5, backoff_base=1.0, backoff_max=60.0):
+        self.bot = bot
+        self.logger = logger
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.global_limiter = TokenBucket(rate)
+        self.chat_limiter = ChatLimiter(per_chat_interval)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.paused_until = 0.0  # Глобальная пауза после RetryAfter
+        self._tasks = []
+
+    @property
+    def queue_depth(self):
+        """Количество сообщений, ожидающих отправки"""
+        return self.queue.qsize()
+
+    def start(self):
+        """Запуск воркеров"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Дожидаемся отправки всей очереди и останавливаем воркеров"""
+        if not self._tasks:
+            return
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, chat_id, text, on_sent=None, on_failed=None, on_start=None):
+        """Постановка сообщения в очередь. При заполненной очереди ждёт освобождения места.
+
+        on_start(chat_id) вызывается один раз непосредственно перед первой попыткой отправки.
+        Любая ошибка доставки, в том числе в on_start или on_sent, передаётся в on_failed(chat_id, error).
+        """
+        await self.queue.put((chat_id, text, on_sent, on_failed, on_start))
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                await self._deliver(*item)
+            except Exception as e:
+                self.logger.error(f"Ошибка в конвейере отправки для {item[0]}: {e}")
+                await self._report_failure(item, e)
+            finally:
+                self.queue.task_done()
+
+    async def _report_failure(self, item, error):
+        """Передача непредвиденной ошибки в on_failed, чтобы владелец сообщения не ждал его исхода вечно"""
+        chat_id, _, _, on_failed, _ = item
+        if not on_failed:
+            return
+        try:
+            await on_failed(chat_id, error)
+        except Exception as e:
+            self.logger.error(f"Ошибка при обработке неудачной отправки для {chat_id}: {e}")
+
+    async def _wait_pause(self):
+        delay = self.paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.paused_until - time.monotonic()
+
+    async def _send(self, chat_id, text):
+        """Один вызов sendMessage с учётом времени и ошибок в метриках"""
+        try:
+            with SEND_SECONDS.time():
+                await self.bot.send_message(chat_id, text, parse_mode='HTML')
+        except (TelegramAPIError, asyncio.TimeoutError) as e:
+            SEND_ERRORS_TOTAL.labels(type(e).__name__).inc()
+            raise
+
+    async def _deliver(self, chat_id, text, on_sent, on_failed, on_start):
+        attempt = 0
+        while True:
+            await self._wait_pause()
+            await self.chat_limiter.acquire(chat_id)
+            await self.global_limiter.acquire()
+            if on_start:
+                await on_start(chat_id)
+                on_start = None
+            try:
+                await self._send(chat_id, text)
+            except RetryAfter as e:
+                # Flood control действует на весь бот: приостанавливаем всех воркеров
+                self.paused_until = max(self.paused_until, time.monotonic() + e.timeout)
+                self.logger.warning(f"Flood control: пауза отправки на {e.timeout} с.")
+                continue
+            except (NetworkError, RestartingTelegram, asyncio.TimeoutError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.logger.error(f"Не удалось отправить сообщение {chat_id} после {self.max_retries} попыток: {e}")
+                    if on_failed:
+                        await on_failed(chat_id, e)
+                    return
+                await asyncio.sleep(min(self.backoff_base * 2 ** (attempt - 1), self.backoff_max))
+                continue
+            except TelegramAPIError as e:
+                if on_failed:
+                    await on_failed(chat_id, e)
+                else:
+                    self.logger.error(f"Ошибка при отправке сообщения {chat_id}: {e}")
+                return
+
+            if on_sent:
+                await on_sent(chat_id)
+            return
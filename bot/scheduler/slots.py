@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import tzlocal
+
+
+# Преобразование дня недели в формат, понятный для cron
+DAYS_MAP = {
+    "Пн": "mon",
+    "Вт": "tue",
+    "Ср": "wed",
+    "Чт": "thu",
+    "Пт": "fri",
+    "Сб": "sat",
+    "Вс": "sun"
+}
+CRON_DAYS = list(DAYS_MAP.values())
+
+WEEK_MINUTES = 7 * 24 * 60
+
+# Города на клавиатуре выбора часового пояса и их пояса IANA
+TIMEZONES = {
+    "Калининград": "Europe/Kaliningrad",
+    "Москва": "Europe/Moscow",
+    "Самара": "Europe/Samara",
+    "Екатеринбург": "Asia/Yekaterinburg",
+    "Омск": "Asia/Omsk",
+    "Новосибирск": "Asia/Novosibirsk",
+    "Красноярск": "Asia/Krasnoyarsk",
+    "Иркутск": "Asia/Irkutsk",
+    "Якутск": "Asia/Yakutsk",
+    "Владивосток": "Asia/Vladivostok",
+    "Магадан": "Asia/Magadan",
+    "Камчатка": "Asia/Kamchatka",
+}
+
+# Часовой пояс пользователей, не указавших свой: пояс сервера (TZ контейнера), в котором бот работал раньше
+DEFAULT_TIMEZONE = tzlocal.get_localzone()
+
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    """Часовой пояс по имени IANA. Пустое или неизвестное имя — пояс по-умолчанию"""
+    if not name:
+        return DEFAULT_TIMEZONE
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return DEFAULT_TIMEZONE
+
+
+def is_valid_timezone(name):
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return False
+
+
+def parse_timezone(text):
+    """Часовой пояс IANA из ответа пользователя: город с клавиатуры, имя IANA (Europe/Berlin) или смещение (UTC+3).
+    None, если пояс не распознан
+    """
+    text = text.strip()
+    if text in TIMEZONES:
+        return TIMEZONES[text]
+
+    offset = text.upper().removeprefix("UTC").removeprefix("GMT").strip()
+    if not offset and text.upper() in ("UTC", "GMT"):
+        return "Etc/UTC"
+    if offset[:1] in ("+", "-") and offset[1:].isdigit() and int(offset[1:]) <= (14 if offset[0] == "+" else 12):
+        # В поясах Etc/GMT знак смещения обратный: UTC+3 — это Etc/GMT-3. Существуют пояса от UTC-12 до UTC+14
+        hours = int(offset[1:])
+        return "Etc/UTC" if hours == 0 else f"Etc/GMT{'-' if offset[0] == '+' else '+'}{hours}"
+
+    return text if "/" in text and is_valid_timezone(text) else None
+
+
+def utc_slot(notify_day, notify_time, tz_name=None, now=None):
+    """UTC-слот пользователя: минута недели в UTC (0 — понедельник 00:00 UTC) ближайшего наступления
+    его локальных дня и времени уведомления.
+
+    Смещение пояса берётся на момент ближайшего срабатывания, поэтому при переходе на летнее или зимнее время
+    слот меняется и его нужно пересчитывать (Database.refresh_utc_slots). Время, которое при переводе часов
+    повторяется, берётся в первый раз; пропущенное — со смещением до перевода (02:30 становится 03:30).
+    """
+    now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    local_now = now.astimezone(get_zone(tz_name))
+    hour, minute = map(int, notify_time.split(":"))
+    days_ahead = (CRON_DAYS.index(DAYS_MAP.get(notify_day, "mon")) - local_now.weekday()) % 7
+    local = (local_now + timedelta(days=days_ahead)).replace(hour=hour, minute=minute, second=0, microsecond=0, fold=0)
+    # Сравнение в UTC: местное время в повторяющийся час неоднозначно
+    moment = local.astimezone(timezone.utc)
+    if moment < now:
+        moment = (local + timedelta(days=7)).astimezone(timezone.utc)
+    return moment.weekday() * 1440 + moment.hour * 60 + moment.minute
+
+
+def slot_job_id(slot):
+    """Детерминированный идентификатор задачи UTC-слота, например slot_mon_06:00 (время UTC)"""
+    return f"slot_{CRON_DAYS[slot // 1440]}_{slot % 1440 // 60:02d}:{slot % 60:02d}"
+
+
+def previous_slot_time(slot, now):
+    """Последнее срабатывание UTC-слота не позже now (datetime с часовым поясом), в UTC"""
+    now = now.astimezone(timezone.utc)
+    week_start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    slot_time = week_start + timedelta(minutes=slot)
+    if slot_time > now:
+        slot_time -= timedelta(days=7)
+    return slot_time
+
+
+def local_date(tz_name, moment):
+    """Дата в часовом поясе пользователя в момент moment (datetime с часовым поясом)"""
+    return moment.astimezone(get_zone(tz_name)).date()
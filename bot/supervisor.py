@@ -0,0 +1,61 @@
+import asyncio
+import os
+import signal
+import sys
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py")
+
+
+class WorkerSupervisor:
+    """Запуск и перезапуск процессов рассылки worker.py, по одному на долю пользователей"""
+
+    def __init__(self, count, logger, metrics_port=None, restart_delay=5.0, stop_timeout=60.0):
+        self.count = count
+        self.logger = logger
+        self.metrics_port = metrics_port
+        self.restart_delay = restart_delay
+        self.stop_timeout = stop_timeout
+        self.processes = {}  # Номер доли -> процесс
+        self._tasks = []
+        self._stopping = False
+
+    @property
+    def alive(self):
+        """Число работающих процессов рассылки"""
+        return sum(process.returncode is None for process in self.processes.values())
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._supervise(index)) for index in range(self.count)]
+
+    async def stop(self):
+        """Остановка процессов: по SIGTERM каждый дорассылает свою очередь"""
+        self._stopping = True
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.gather(*self._tasks, return_exceptions=True), self.stop_timeout)
+        except asyncio.TimeoutError:
+            self.logger.error("Процессы рассылки не остановились вовремя и будут завершены принудительно.")
+            for process in self.processes.values():
+                if process.returncode is None:
+                    process.kill()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _env(self, index):
+        env = dict(os.environ, NOTIFIER_SHARD=f"{index}/{self.count}", LOG_FILE=f"worker-{index}.log")
+        if self.metrics_port:
+            env['METRICS_PORT'] = str(int(self.metrics_port) + 1 + index)
+        return env
+
+    async def _supervise(self, index):
+        while not self._stopping:
+            process = await asyncio.create_subprocess_exec(sys.executable, WORKER_SCRIPT, env=self._env(index))
+            self.processes[index] = process
+            self.logger.info(f"Процесс рассылки {index}/{self.count} запущен (pid {process.pid}).")
+            returncode = await process.wait()
+            if not self._stopping:
+                self.logger.error(f"Процесс рассылки {index}/{self.count} завершился с кодом {returncode}, перезапуск через {self.restart_delay} с.")
+                await asyncio.sleep(self.restart_delay)
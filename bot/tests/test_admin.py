@@ -0,0 +1,50 @@
+"""Проверки записей пользователей при загрузке из JSONL и CSV.
+
+Запуск из каталога bot:
+    python -m pytest tests
+"""
+from datetime import date
+import pytest
+from admin import validate_user
+from db import USER_FIELDS
+
+VALID = {'user_id': '1', 'username': 'bob', 'custom_name': 'Боб', 'birthdate': '1990-01-01',
+         'notify_day': 'Пн', 'notify_time': '9:05'}
+
+
+def validate(**changes):
+    return dict(zip(USER_FIELDS, validate_user({**VALID, **changes}, date(2026, 10, 18), "2026-10-18 12:00:00")))
+
+
+def test_valid_record_is_normalized():
+    user = validate(handshake="2024-01-01T10:00:00", active="False")
+    assert (user['user_id'], user['notify_time'], user['handshake'], user['active']) == (1, "09:05", "2024-01-01 10:00:00", 0)
+    assert validate(handshake="")['handshake'] == "2026-10-18 12:00:00"
+
+
+@pytest.mark.parametrize("active, expected", [(None, 1), ("", 1), (1, 1), (0, 0), (True, 1), (False, 0), ("1", 1), ("true", 1)])
+def test_active_values(active, expected):
+    assert validate(active=active)['active'] == expected
+
+
+def test_custom_name_falls_back_to_username():
+    assert validate(custom_name="")['custom_name'] == "bob"
+
+
+@pytest.mark.parametrize("changes", [
+    {'user_id': 'abc'},
+    {'birthdate': '2030-01-01'},
+    {'birthdate': 19900101},
+    {'notify_day': 'Mon'},
+    {'notify_time': '24:00'},
+    {'timezone': 'Mars/Base'},
+    {'last_notification': 'вчера'},
+    {'handshake': 'вчера'},
+    {'handshake': 5},
+    {'custom_name': '', 'username': ''},
+    {'active': 'yes'},
+    {'active': 2},
+])
+def test_invalid_records_are_rejected(changes):
+    with pytest.raises(ValueError):
+        validate(**changes)
@@ -0,0 +1,187 @@
+"""Проверки outbox: захват и возврат уведомлений, восстановление после аварийной остановки,
+одно уведомление в неделю при повторной рассылке слота и догоне, ограничение возраста догона,
+ошибки до начала отправки.
+
+Запуск из каталога bot:
+    python -m pytest tests
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+import pytest
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from db import AsyncDatabase, Database
+from scheduler.notifier import Notifier
+from scheduler.outbox import Outbox
+from scheduler.sender import SendPipeline
+from scheduler.slots import CRON_DAYS, DAYS_MAP, utc_slot
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def db():
+    db = Database(":memory:")
+    yield db
+    db.close()
+
+
+def states(db):
+    return dict(db.cursor.execute("SELECT user_id, state FROM outbox").fetchall())
+
+
+def enqueue(db, user_ids, week="2026-W42", due_at=None):
+    return db.enqueue_outbox([(user_id, week, f"text {user_id}", due_at or time.time()) for user_id in user_ids])
+
+
+def test_claim_and_release(db):
+    assert enqueue(db, [1, 2, 3]) == 3
+    batch = db.claim_outbox(2)
+    assert [user_id for _, user_id, _ in batch] == [1, 2]
+    assert states(db) == {1: 'claimed', 2: 'claimed', 3: 'pending'}
+
+    # Захваченное не достаётся повторно, пока не возвращено
+    assert [user_id for _, user_id, _ in db.claim_outbox(10)] == [3]
+    assert db.claim_outbox(10) == []
+
+    db.start_outbox(batch[0][0])
+    db.release_outbox([outbox_id for outbox_id, _, _ in batch])
+    # Начатая отправка не возвращается: уведомление могло уже дойти
+    assert states(db) == {1: 'sending', 2: 'pending', 3: 'claimed'}
+    assert [user_id for _, user_id, _ in db.claim_outbox(10)] == [2]
+
+
+def test_claim_skips_future_and_other_shards(db):
+    enqueue(db, [1, 2, 3, 4])
+    enqueue(db, [5], due_at=time.time() + 3600)
+    assert sorted(user_id for _, user_id, _ in db.claim_outbox(10, shard=(1, 2))) == [1, 3]
+    assert sorted(user_id for _, user_id, _ in db.claim_outbox(10)) == [2, 4]
+
+
+def test_recover_outbox(db):
+    enqueue(db, [1, 2, 3, 4])
+    batch = db.claim_outbox(3)
+    db.start_outbox(batch[0][0])
+    db.finish_outbox([(batch[0][0], 1, 'sent', datetime(2026, 10, 18).date())])
+    db.start_outbox(batch[1][0])
+
+    assert db.recover_outbox() == (1, 1)
+    assert states(db) == {1: 'sent', 2: 'failed', 3: 'pending', 4: 'pending'}
+    assert db.recover_outbox() == (0, 0)
+
+
+def test_recover_outbox_only_own_shard(db):
+    enqueue(db, [1, 2])
+    for outbox_id, _, _ in db.claim_outbox(10):
+        db.start_outbox(outbox_id)
+    assert db.recover_outbox(shard=(0, 2)) == (0, 1)
+    assert states(db) == {1: 'sending', 2: 'failed'}
+
+
+def test_finish_does_not_override_released(db):
+    enqueue(db, [1])
+    [(outbox_id, _, _)] = db.claim_outbox(10)
+    db.release_outbox([outbox_id])
+    db.finish_outbox([(outbox_id, 1, 'failed', None)])
+    assert states(db) == {1: 'pending'}
+
+
+def test_one_notification_per_week(db):
+    assert enqueue(db, [1, 2]) == 2
+    assert enqueue(db, [1, 2, 3]) == 1
+    for outbox_id, _, _ in db.claim_outbox(10):
+        db.start_outbox(outbox_id)
+        db.finish_outbox([(outbox_id, 0, 'sent', None)])
+    # Отправленное тоже не повторяется, следующая неделя ставится
+    assert enqueue(db, [1]) == 0
+    assert enqueue(db, [1], week="2026-W43") == 1
+
+
+async def seed_slot(db, moment, users):
+    """Пользователи 1..users с уведомлением в минуту moment (UTC). Возвращает слот"""
+    day = next(day for day, cron_day in DAYS_MAP.items() if cron_day == CRON_DAYS[moment.weekday()])
+    await db.upsert_users([
+        (user_id, f"user{user_id}", "User", "Имя", "1990-01-01", "2020-01-01 00:00:00",
+         day, moment.strftime("%H:%M"), "Etc/UTC", None, 1)
+        for user_id in range(1, users + 1)
+    ])
+    return utc_slot(day, moment.strftime("%H:%M"), "Etc/UTC", moment)
+
+
+def make_notifier(db, **kwargs):
+    return Notifier(None, db, logger, AsyncIOScheduler(timezone="UTC"), SendPipeline(None, logger), **kwargs)
+
+
+def test_redispatch_and_catch_up_enqueue_once():
+    async def run():
+        db = AsyncDatabase(":memory:")
+        try:
+            # Слот текущей минуты в UTC: рассылка и догон относятся к одному срабатыванию
+            slot = await seed_slot(db, datetime.now(timezone.utc).replace(second=0, microsecond=0), 5)
+            notifier = make_notifier(db, catchup_rate=1000)
+
+            await notifier.dispatch_slot(slot)
+            await notifier.dispatch_slot(slot)
+            await notifier.catch_up_missed()
+            return await db.count_outbox()
+        finally:
+            await db.close()
+
+    assert asyncio.run(run()) == {'pending': 5}
+
+
+def test_catch_up_stops_when_slot_gets_too_old():
+    async def run():
+        db = AsyncDatabase(":memory:")
+        try:
+            slot_time = datetime.now(timezone.utc).replace(second=0, microsecond=0) - timedelta(hours=1)
+            await seed_slot(db, slot_time, 3)
+            # Порция в секунду: ко второй порции срабатывание старше часа
+            notifier = make_notifier(db, catchup_rate=1, catchup_max_age=timedelta(hours=1))
+            await notifier.catch_up_missed(slot_time + timedelta(hours=1, seconds=-0.5))
+            return await db.count_outbox()
+        finally:
+            await db.close()
+
+    assert asyncio.run(run()) == {'pending': 1}
+
+
+def test_failed_start_releases_claim(db):
+    class FailingStart:
+        """Обёртка базы, в которой перевод в sending падает"""
+
+        def __init__(self, db):
+            self.db = db
+
+        async def start_outbox(self, outbox_id):
+            raise RuntimeError("database is locked")
+
+        async def release_outbox(self, ids):
+            self.db.release_outbox(ids)
+
+    enqueue(db, [1])
+    [(outbox_id, user_id, _)] = db.claim_outbox(10)
+    outbox = Outbox(FailingStart(db), None, logger, None, None)
+    with pytest.raises(RuntimeError):
+        asyncio.run(outbox._on_start(outbox_id, user_id))
+    assert states(db) == {1: 'pending'}
+
+
+def test_pipeline_reports_unexpected_errors():
+    failed = []
+
+    async def on_start(chat_id):
+        raise RuntimeError("database is locked")
+
+    async def on_failed(chat_id, error):
+        failed.append((chat_id, str(error)))
+
+    async def run():
+        pipeline = SendPipeline(None, logger, workers=1)
+        pipeline.start()
+        await pipeline.submit(1, "text", None, on_failed, on_start)
+        await pipeline.stop()
+
+    asyncio.run(run())
+    assert failed == [(1, "database is locked")]
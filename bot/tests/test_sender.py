@@ -0,0 +1,22 @@
+"""Проверки ограничителя частоты отправки.
+
+Запуск из каталога bot:
+    python -m pytest tests
+"""
+import time
+import pytest
+from scheduler.sender import TokenBucket
+
+
+@pytest.mark.parametrize("rate", [0.25, 0.5, 1])
+def test_token_bucket_holds_at_least_one_token(rate):
+    bucket = TokenBucket(rate)
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_token_bucket_refills_below_one_per_second():
+    bucket = TokenBucket(0.5)
+    assert bucket.try_acquire()
+    bucket.updated -= 2  # Прошло две секунды
+    assert bucket.try_acquire()
@@ -0,0 +1,144 @@
+"""Проверки перевода локального времени уведомления в UTC-слоты: переходы на летнее и зимнее время,
+пояса с получасовым смещением, переход через границу недели и разбор часового пояса из ответа пользователя.
+
+Запуск из каталога bot:
+    python -m pytest tests
+"""
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import pytest
+from db import Database
+from scheduler.slots import CRON_DAYS, DAYS_MAP, parse_timezone, previous_slot_time, slot_job_id, utc_slot
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def slot(day, hhmm):
+    """Минута недели в UTC: slot('sun', '07:00')"""
+    hour, minute = map(int, hhmm.split(":"))
+    return CRON_DAYS.index(day) * 1440 + hour * 60 + minute
+
+
+# Европа переводит часы в последнее воскресенье марта и октября в 01:00 UTC: 29.03.2026 и 25.10.2026
+@pytest.mark.parametrize("now, expected", [
+    (utc(2026, 10, 18, 6), slot('sun', '07:00')),   # Ближайшее 09:00 сегодня, ещё летнее время (UTC+2)
+    (utc(2026, 10, 18, 12), slot('sun', '08:00')),  # Сегодняшнее прошло, следующее — уже по зимнему (UTC+1)
+    (utc(2026, 10, 20), slot('sun', '08:00')),
+    (utc(2026, 3, 23), slot('sun', '07:00')),       # Весной наоборот
+    (utc(2026, 3, 20), slot('sun', '08:00')),
+])
+def test_dst_transition_moves_slot(now, expected):
+    assert utc_slot("Вс", "09:00", "Europe/Berlin", now) == expected
+
+
+def test_repeated_hour_uses_first_occurrence():
+    # 25.10.2026 02:30 по Берлину наступает дважды: в 00:30 UTC (летнее) и в 01:30 UTC (зимнее)
+    assert utc_slot("Вс", "02:30", "Europe/Berlin", utc(2026, 10, 20)) == slot('sun', '00:30')
+
+
+def test_repeated_hour_after_first_occurrence_waits_for_next_week():
+    # 01:10 UTC — 02:10 по Берлину во второй раз: первое 02:30 уже было, следующее — через неделю по зимнему
+    assert utc_slot("Вс", "02:30", "Europe/Berlin", utc(2026, 10, 25, 1, 10)) == slot('sun', '01:30')
+
+
+def test_skipped_hour_uses_offset_before_transition():
+    # 29.03.2026 02:30 по Берлину не существует: уведомление приходит в 03:30 летнего времени
+    assert utc_slot("Вс", "02:30", "Europe/Berlin", utc(2026, 3, 23)) == slot('sun', '01:30')
+    assert utc_slot("Вс", "02:30", "Europe/Berlin", utc(2026, 3, 30)) == slot('sun', '00:30')
+
+
+@pytest.mark.parametrize("tz_name, day, hhmm, expected", [
+    ("Asia/Kolkata", "Пн", "09:00", slot('mon', '03:30')),     # UTC+5:30
+    ("Asia/Kathmandu", "Пн", "00:00", slot('sun', '18:15')),   # UTC+5:45, переход через начало недели назад
+    ("America/St_Johns", "Вс", "21:00", slot('sun', '23:30')),  # UTC-2:30 (летнее время)
+    ("Asia/Vladivostok", "Пн", "09:00", slot('sun', '23:00')),
+    ("America/Los_Angeles", "Вс", "20:00", slot('mon', '03:00')),  # Переход через конец недели вперёд
+    ("Etc/GMT-14", "Пн", "05:00", slot('sun', '15:00')),
+    ("Etc/UTC", "Вс", "23:59", slot('sun', '23:59')),
+])
+def test_offsets_and_week_wrap(tz_name, day, hhmm, expected):
+    assert utc_slot(day, hhmm, tz_name, utc(2026, 10, 20)) == expected
+
+
+def test_unknown_timezone_falls_back_to_default():
+    now = utc(2026, 10, 20)
+    assert utc_slot("Пн", "09:00", "Mars/Base", now) == utc_slot("Пн", "09:00", None, now)
+
+
+@pytest.mark.parametrize("tz_name", [
+    "Europe/Berlin", "America/New_York", "America/St_Johns", "Australia/Sydney",
+    "Pacific/Auckland", "Asia/Kolkata", "Asia/Kathmandu", "Pacific/Pago_Pago", "Etc/GMT-14",
+])
+def test_next_firing_is_local_time(tz_name):
+    """Ближайшее срабатывание слота приходится на заданные день и время пользователя в течение всего года"""
+    zone = ZoneInfo(tz_name)
+    for now in (utc(2026, 1, 1) + timedelta(days=days, hours=7) for days in range(0, 365, 5)):
+        for day in DAYS_MAP:
+            for hhmm in ("00:00", "09:30", "23:00"):
+                firing = previous_slot_time(utc_slot(day, hhmm, tz_name, now), now + timedelta(days=7))
+                local = firing.astimezone(zone)
+                assert now <= firing < now + timedelta(days=7)
+                assert (CRON_DAYS[local.weekday()], local.strftime("%H:%M")) == (DAYS_MAP[day], hhmm)
+
+
+@pytest.mark.parametrize("minute, now, expected", [
+    (slot('tue', '10:00'), utc(2026, 10, 20, 10), utc(2026, 10, 20, 10)),         # Ровно в момент срабатывания
+    (slot('tue', '10:00'), utc(2026, 10, 20, 9, 59), utc(2026, 10, 13, 10)),
+    (slot('sun', '23:00'), utc(2026, 10, 19, 1), utc(2026, 10, 18, 23)),          # Через начало недели
+    (slot('mon', '00:00'), utc(2026, 10, 18, 23, 59), utc(2026, 10, 12)),
+    (slot('mon', '03:00'), datetime(2026, 10, 19, 6, tzinfo=ZoneInfo("Europe/Moscow")), utc(2026, 10, 19, 3)),
+])
+def test_previous_slot_time(minute, now, expected):
+    assert previous_slot_time(minute, now) == expected
+
+
+@pytest.mark.parametrize("minute, job_id", [
+    (0, "slot_mon_00:00"),
+    (slot('mon', '03:30'), "slot_mon_03:30"),
+    (7 * 1440 - 1, "slot_sun_23:59"),
+])
+def test_slot_job_id(minute, job_id):
+    assert slot_job_id(minute) == job_id
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Москва", "Europe/Moscow"),
+    (" Владивосток ", "Asia/Vladivostok"),
+    ("UTC+3", "Etc/GMT-3"),
+    ("utc-11", "Etc/GMT+11"),
+    ("GMT+14", "Etc/GMT-14"),
+    ("+5", "Etc/GMT-5"),
+    ("UTC", "Etc/UTC"),
+    ("UTC+0", "Etc/UTC"),
+    ("Europe/Berlin", "Europe/Berlin"),
+    ("Asia/Kolkata", "Asia/Kolkata"),
+    ("UTC+5:30", None),  # Получасовые смещения — только именем пояса
+    ("UTC+15", None),
+    ("UTC-13", None),
+    ("Mars/Base", None),
+    ("Berlin", None),
+    ("", None),
+])
+def test_parse_timezone(text, expected):
+    assert parse_timezone(text) == expected
+
+
+def test_refresh_utc_slots_after_dst_transition():
+    db = Database(":memory:")
+    try:
+        db.add_user(1, "a", "A", "a", "1990-01-01", "Вс", "09:00", "Europe/Berlin")
+        db.add_user(2, "b", "B", "b", "1990-01-01", "Вс", "09:00", "Europe/Berlin")
+        db.add_user(3, "c", "C", "c", "1990-01-01", "Вс", "09:00", "Europe/Moscow")
+
+        db.refresh_utc_slots(utc(2026, 10, 18, 6))
+        assert sorted(db.get_slots()) == [slot('sun', '06:00'), slot('sun', '07:00')]
+
+        # После перехода на зимнее время меняется слот только берлинской группы, одним пересчётом
+        assert db.refresh_utc_slots(utc(2026, 10, 20)) == 2
+        assert sorted(db.get_slots()) == [slot('sun', '06:00'), slot('sun', '08:00')]
+        assert [user_id for user_id, _ in db.get_slot_users(slot('sun', '08:00'))] == [1, 2]
+        assert db.refresh_utc_slots(utc(2026, 10, 20)) == 0
+    finally:
+        db.close()
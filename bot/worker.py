@@ -0,0 +1,33 @@
+import asyncio
+import signal
+from core import bot, db, logger, notifier, NOTIFIER_SHARD, METRICS_PORT, METRICS_HOST
+from metrics import start_metrics_server
+
+
+async def run():
+    """Процесс рассылки: задачи слотов и отправка уведомлений своей доли пользователей до сигнала остановки"""
+    stopped = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT), METRICS_HOST)
+    await notifier.start()
+    await stopped.wait()
+
+    try:
+        await notifier.stop()
+    except Exception as e:
+        logger.error(f"Ошибка при остановке планировщика: {e}")
+    await db.close()
+    await (await bot.get_session()).close()
+
+
+# Запуск процесса рассылки: NOTIFIER_SHARD=0/2 python worker.py
+if __name__ == '__main__':
+    if not NOTIFIER_SHARD:
+        raise SystemExit("Не задана доля пользователей процесса рассылки (NOTIFIER_SHARD=index/count).")
+    logger.info(f"Процесс рассылки {NOTIFIER_SHARD} запущен.")
+    asyncio.get_event_loop().run_until_complete(run())
+    logger.info(f"Процесс рассылки {NOTIFIER_SHARD} остановлен.")